@@ -85,12 +85,14 @@ class ClassE(wx.Frame):
         self.overviewTab = OverviewPanel(nb, sesModel=self.model)
         self.logTab = LogPanel(nb, sesModel=self.model)
         self.fairnessTab = FairnessPanel(nb, sesModel=self.model)
+        self.progressTab = ProgressPanel(nb, sesModel=self.model)
 
         nb.AddPage(self.overviewTab, "Dashboard")
         nb.AddPage(self.capTab, "Excess Capacity")
         nb.AddPage(self.prefTab, "Preferences")
         nb.AddPage(self.fairnessTab, "Fairness")
         nb.AddPage(self.heatMapTab, "Heat Maps")
+        nb.AddPage(self.progressTab, "Solver Progress")
         nb.AddPage(self.logTab, "Logger")
         
         nb_sizer = wx.BoxSizer(wx.VERTICAL)
@@ -286,15 +288,34 @@ class OptimizationPanel(MyPanel):
                 (wx.StaticText(self)), 
                 (wx.StaticText(self)) ])
 
+        #penalty for moving courses from the assignments added in Step 1
+        fgs.Add(wx.StaticText(self, label="Stability"))
+        self.Stability = wx.lib.intctrl.IntCtrl(self, value=0, 
+                min=0, max=100, size=(34,22))
+        fgs.AddMany([ (self.Stability),
+                (wx.StaticText(self)), 
+                (wx.StaticText(self)) ])
+
         self.optimize_btn = wx.Button(self, label="Optimize")
         self.optimize_btn.Bind(wx.EVT_BUTTON, self.onOptimize)
         fgs.Add(self.optimize_btn)
+
+        self.cancel_btn = wx.Button(self, label="Cancel")
+        self.cancel_btn.Bind(wx.EVT_BUTTON, self.onCancel)
+        self.cancel_btn.Disable()
+        fgs.Add(self.cancel_btn)
+
+        self.preview_btn = wx.Button(self, label="Preview")
+        self.preview_btn.Bind(wx.EVT_BUTTON, self.onPreview)
+        fgs.Add(self.preview_btn)
         
         self.SetSizerAndFit(box_sizer)
         self.Disable()
         
         pub.subscribe(self.enable, "data_loaded")
         pub.subscribe(self.updateWeights, "update_weights")
+        pub.subscribe(self.optimizationStarted, "optimization_started")
+        pub.subscribe(self.optimizationFinished, "optimization_finished")
         
     def enable(self, message):
         """Listener for the Data-Loaded Message"""
@@ -311,11 +332,34 @@ class OptimizationPanel(MyPanel):
                 self.ExcessCap.GetValue(), 
                 self.CongPenalty.GetValue(), 
                 self.DeptFairness.GetValue(), 
-                self.Back2Back.GetValue())
+                self.Back2Back.GetValue(), 
+                self.Stability.GetValue())
 
     def onOptimize(self, event):
         pub.sendMessage("status_bar", "")
-        self.model.optimize()
+        #solve off the event thread, messages come back via wx.CallAfter
+        self.model.optimizeAsync(wx.CallAfter)
+
+    def onCancel(self, event):
+        self.model.cancelOptimize()
+
+    def onPreview(self, event):
+        """Heuristic schedule, in seconds"""
+        pub.sendMessage("status_bar", "")
+        #off the event thread too, building alone can take minutes
+        self.model.previewAsync(wx.CallAfter)
+
+    def optimizationStarted(self, message):
+        """Listener for the optimization started message"""
+        self.optimize_btn.Disable()
+        self.preview_btn.Disable()
+        self.cancel_btn.Enable()
+
+    def optimizationFinished(self, message):
+        """Listener for the optimization finished message"""
+        self.optimize_btn.Enable()
+        self.preview_btn.Enable()
+        self.cancel_btn.Disable()
 
 
 
@@ -0,0 +1,271 @@
+"""Columnar store of the (course, room, TimeSlot) candidates of the optimization
+
+Each candidate is a potential assignment and becomes one binary in the model.
+Rather than a list of object tuples, candidates are stored as parallel int32
+arrays indexing into lookup tables of the underlying objects.
+"""
+import numpy as np
+import sesClasses as ses
+import helpers
+from readData import CourseIndex
+
+def groupBy(keys, vals):
+    """Group vals by keys.  Returns a list of (key, array of vals)
+    with keys in sorted order and vals in their original order."""
+    if not len(keys):
+        return []
+    order = np.argsort(keys, kind="mergesort")
+    keys, vals = keys[order], vals[order]
+    breaks = np.nonzero(keys[1:] <> keys[:-1])[0] + 1
+    starts = np.concatenate(([0], breaks))
+    return zip(keys[starts], np.split(vals, breaks))
+
+def _indexer(items, table, lookup):
+    """Return the index of each item, appending new items to table"""
+    out = []
+    for item in items:
+        if item not in lookup:
+            lookup[item] = len(table)
+            table.append(item)
+        out.append(lookup[item])
+    return out
+
+class CandidateTable:
+    """Candidates (course, room, TimeSlot) as parallel arrays.
+
+    Candidates for a course are contiguous and appear in the order of course_list.
+    Attributes:
+        course_ix, room_ix, ts_ix - int32 arrays, one entry per candidate
+        courses, rooms, timeslots - lookup tables back to the objects
+        course_ptr - candidates of course k are course_ptr[k]:course_ptr[k+1]
+        room_floor - index of the (bldg, floor) of each room
+        instructors - lookup table of instructors
+        prof_ptr, prof_ix - instructors of course k are prof_ix[prof_ptr[k]:prof_ptr[k+1]]
+        lecrec_ix - index of number + section for each course.
+        is_rec, is_breakout - boolean arrays over courses
+        room_viable - boolean matrix of courses x roomInventory, see helpers.roomViability.
+            None until genCandidates
+        room_classes - list of the inventory rooms each of the first len(room_classes) rooms
+            stands for.  Singletons unless aggregated, see helpers.roomClasses
+        room_size - number of inventory rooms each room stands for, 1 for rooms outside
+            the inventory.  Set by genCandidates
+
+    After indexInstants(), atInstant(ts) returns the candidates occupying ts
+    without rescanning the table.
+    """
+    def __init__(self, course_list, roomInventory, room_classes=None):
+        """room_classes lists the inventory rooms represented by a single room, 
+        see helpers.roomClasses.  Every room is its own class if None"""
+        self.courses = list(course_list)
+        if room_classes is None:
+            room_classes = [[r] for r in roomInventory]
+        self.room_classes = room_classes
+
+        #candidates are generated over the first room of each class
+        self.roomInventory = [members[0] for members in self.room_classes]
+        self.rooms, self._room_lookup = [], {}
+        self.timeslots, self._ts_lookup = [], {}
+        _indexer(self.roomInventory, self.rooms, self._room_lookup)
+        for r, members in enumerate(self.room_classes):
+            for room in members:
+                self._room_lookup[room] = r
+
+        self.course_ix = np.zeros(0, dtype=np.int32)
+        self.room_ix = np.zeros(0, dtype=np.int32)
+        self.ts_ix = np.zeros(0, dtype=np.int32)
+        self.course_ptr = np.zeros(1, dtype=np.int32)
+        self.room_viable = None
+        self._instant_index = {}
+        self._course_lookup = dict((c.key, k) for k, c in enumerate(self.courses))
+
+        #course level data
+        self.instructors, prof_lookup = [], {}
+        prof_lists = [_indexer(c.getInstructors(), self.instructors, prof_lookup)
+                        for c in self.courses]
+        self.prof_ptr = np.cumsum([0] + map(len, prof_lists)).astype(np.int32)
+        self.prof_ix = np.array([p for profs in prof_lists for p in profs], dtype=np.int32)
+        self.lecrec_ix = np.array(_indexer([c.number + c.section for c in self.courses],
+                                [], {}), dtype=np.int32)
+        self.is_rec = np.array([c.isRec() for c in self.courses], dtype=bool)
+        self.is_breakout = np.array([c.isBreakout() for c in self.courses], dtype=bool)
+
+    def genCandidates(self, config, forbiddenTimes, warn=True):
+        """Enumerate the allowed (room, time) for every course.
+        warn is as in helpers.allowedRooms"""
+        self.room_viable = helpers.roomViability(self.courses, self.roomInventory)
+        course_ix, room_ix, ts_ix, ptr = [], [], [], [0]
+        for ix, course in enumerate(self.courses):
+            room_times = helpers.allowedRoomTimes(course, config, self.roomInventory,
+                                                  forbiddenTimes, self.room_viable[ix], warn)
+            course_ix += [ix] * len(room_times)
+            room_ix += _indexer([r for r, ts in room_times], self.rooms, self._room_lookup)
+            ts_ix += _indexer([ts for r, ts in room_times], self.timeslots, self._ts_lookup)
+            ptr.append(len(course_ix))
+
+        self.course_ix = np.array(course_ix, dtype=np.int32)
+        self.room_ix = np.array(room_ix, dtype=np.int32)
+        self.ts_ix = np.array(ts_ix, dtype=np.int32)
+        self.course_ptr = np.array(ptr, dtype=np.int32)
+
+        #rooms outside inventory may have been added above
+        floors = [(r.bldg, r.roomNum[:1]) for r in self.rooms]
+        self.room_floor = np.array(_indexer(floors, [], {}), dtype=np.int32)
+        self.room_size = np.array([len(members) for members in self.room_classes] + 
+                                  [1] * (len(self.rooms) - len(self.room_classes)), dtype=int)
+
+    def keepTimes(self, times):
+        """Drop the candidates of course k not at times[k], unless times[k] is None.
+        Raises SESError if times[k] is not allowed for course k"""
+        fixed = np.array([-1 if ts is None else self._ts_lookup.get(ts, -2) for ts in times], 
+                         dtype=np.int32)
+        keep = (fixed[self.course_ix] == -1) | (self.ts_ix == fixed[self.course_ix])
+        counts = np.bincount(self.course_ix[keep], minlength=len(self.courses))
+        if (counts == 0).any():
+            k = np.nonzero(counts == 0)[0][0]
+            raise ses.SESError("Time %s is not allowed for course %s" % 
+                                (times[k], self.courses[k]))
+
+        self.course_ix, self.room_ix, self.ts_ix = (self.course_ix[keep], self.room_ix[keep], 
+                                                    self.ts_ix[keep])
+        self.course_ptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int32)
+
+    def __len__(self):
+        return len(self.course_ix)
+
+    def candidate(self, i):
+        """Return the (course, room, TimeSlot) of candidate i"""
+        return (self.courses[self.course_ix[i]], self.rooms[self.room_ix[i]],
+                self.timeslots[self.ts_ix[i]])
+
+    def candidatesOfCourse(self, k):
+        """Indices of the candidates of the kth course"""
+        return np.arange(self.course_ptr[k], self.course_ptr[k + 1])
+
+    def roomMembers(self, r):
+        """The rooms of the inventory room r stands for"""
+        if r < len(self.room_classes):
+            return self.room_classes[r]
+        return [self.rooms[r]]
+
+    def candidateOf(self, k, room, ts):
+        """Index of the candidate (room, ts) of the kth course, or None if not allowed"""
+        r, t = self._room_lookup.get(room), self._ts_lookup.get(ts)
+        if r is None or t is None:
+            return None
+        idx = self.candidatesOfCourse(k)
+        hits = idx[(self.room_ix[idx] == r) & (self.ts_ix[idx] == t)]
+        return hits[0] if len(hits) else None
+
+    def candidatesOfCourses(self, ks):
+        """Indices of the candidates of all courses in ks"""
+        return np.concatenate([self.candidatesOfCourse(k) for k in ks] + 
+                              [np.zeros(0, dtype=int)])
+
+    def coursesMatching(self, num, sec, classtype):
+        """Indices of the courses matching (number, section, classtype) as in Course.isSame"""
+        k = self._course_lookup.get(CourseIndex.key(num, sec, classtype))
+        return [] if k is None else [k]
+
+    def slotAdjacency(self, ts_ixs):
+        """Boolean matrix over timeslots, adj[i, j] = timeslots[i].isB2B(timeslots[j])
+        for i, j in ts_ixs and False otherwise.  isB2B only depends on the days,
+        start and end, so it is evaluated once per distinct (days, start, end)"""
+        ts_ixs = np.unique(ts_ixs)
+        reps, lookup, shape_of = [], {}, []
+        for j in ts_ixs.tolist():
+            ts = self.timeslots[j]
+            key = (ts.dayMask, ts.startMin, ts.endMin)
+            if key not in lookup:
+                lookup[key] = len(reps)
+                reps.append(ts)
+            shape_of.append(lookup[key])
+
+        shape_adj = np.array([[ts1.isB2B(ts2) for ts2 in reps] for ts1 in reps],
+                             dtype=bool).reshape(len(reps), len(reps))
+        adj = np.zeros((len(self.timeslots), len(self.timeslots)), dtype=bool)
+        adj[np.ix_(ts_ixs, ts_ixs)] = shape_adj[np.ix_(shape_of, shape_of)]
+        return adj
+
+    def overlapping(self, time_slot):
+        """Indices of the candidates that overlap time_slot"""
+        ts_overlaps = np.array([time_slot.overlap(ts) for ts in self.timeslots], dtype=bool)
+        return np.nonzero(ts_overlaps[self.ts_ix])[0]
+
+    def indexInstants(self, instants):
+        """Precompute the inverted index instant -> candidates for each TimeSlot 
+        in instants.  Only the few hundred distinct candidate TimeSlots are tested 
+        for overlap; candidates are then looked up by their TimeSlot"""
+        #bit k of ts_masks[j] is set iff timeslot j overlaps instants[k]
+        ts_masks = [sum(1 << k for k, its in enumerate(instants) if its.overlap(ts)) 
+                        for ts in self.timeslots]
+
+        #candidates of timeslot j are ts_order[ts_ptr[j]:ts_ptr[j+1]]
+        ts_order = np.argsort(self.ts_ix, kind="mergesort")
+        ts_ptr = np.searchsorted(self.ts_ix[ts_order], np.arange(len(self.timeslots) + 1))
+
+        self._instant_index = {}
+        for k, its in enumerate(instants):
+            idx = [ts_order[ts_ptr[j]:ts_ptr[j + 1]] 
+                    for j, mask in enumerate(ts_masks) if mask >> k & 1]
+            self._instant_index[its] = np.sort(np.concatenate(idx + [np.zeros(0, dtype=int)]))
+
+    def atInstant(self, time_slot):
+        """Indices of the candidates that overlap time_slot.
+        Uses the precomputed index when available"""
+        if time_slot in self._instant_index:
+            return self._instant_index[time_slot]
+        return self.overlapping(time_slot)
+
+    def expandInstructors(self, idx):
+        """For candidates idx, return parallel arrays (prof, candidate) with
+        one entry for every instructor of the candidate's course"""
+        courses = self.course_ix[idx]
+        starts = self.prof_ptr[courses]
+        counts = self.prof_ptr[courses + 1] - starts
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.prof_ix[np.repeat(starts, counts) + offsets], np.repeat(idx, counts)
+
+    def keepsAssignments(self, assignments):
+        """Boolean arrays (same room, same time) over candidates, whether each keeps 
+        the room and the time of assignments[k], a (room, TimeSlot) or None, of its course"""
+        ref_room = -np.ones(len(self.courses), dtype=int)
+        ref_ts = -np.ones(len(self.courses), dtype=int)
+        for k, assignment in enumerate(assignments):
+            if assignment is not None:
+                room, ts = assignment
+                ref_room[k] = self._room_lookup.get(room, -1)
+                ref_ts[k] = self._ts_lookup.get(ts, -1)
+        return (self.room_ix == ref_room[self.course_ix], 
+                self.ts_ix == ref_ts[self.course_ix])
+
+    def excessCapacity(self):
+        """helpers.e_cap of every candidate"""
+        capacity = np.array([r.capacity for r in self.rooms], dtype=float)[self.room_ix]
+        enrollment = np.array([c.enrollment for c in self.courses], dtype=float)[self.course_ix]
+        return np.maximum((capacity - enrollment) / capacity, 0)
+
+    def choiceHits(self):
+        """Matrix choices x candidates.  Entry [ix, i] counts whether candidate i
+        is the course's (ix + 1)th room choice plus whether it is its (ix + 1)th time choice"""
+        num_choices = max([len(c.roomPrefs) for c in self.courses] + 
+                          [len(c.timePrefs) for c in self.courses] + [1])
+        hits = np.zeros((num_choices, len(self)))
+        for k, c in enumerate(self.courses):
+            idx = self.candidatesOfCourse(k)
+            for ix, r in enumerate(c.roomPrefs):
+                hits[ix, idx[self.room_ix[idx] == self._room_lookup.get(r, -1)]] += 1
+            for ix, ts in enumerate(c.timePrefs):
+                hits[ix, idx[self.ts_ix[idx] == self._ts_lookup.get(ts, -1)]] += 1
+        return hits
+
+    def onPreferredDays(self):
+        """Boolean array, Course.isPreferredDays of every candidate"""
+        days = [ts.days for ts in self.timeslots]
+        return np.array([days[t] in self.courses[k].pref_days 
+                            for k, t in zip(self.course_ix.tolist(), self.ts_ix.tolist())], 
+                        dtype=bool)
+
+    def coursesNamed(self, names):
+        """Boolean array over courses whose str() is in names"""
+        names = set(names)
+        return np.array([str(c) in names for c in self.courses], dtype=bool)
@@ -3,6 +3,8 @@
 Contains constants particular to the SES
 """
 from sesClasses import TimeSlot
+from platform import system
+import os
 
 #Heat Maps for requests
 __time_grid__ = ["8:30 AM", "9:00 AM", "9:30 AM", "10:00 AM", "10:30 AM", 
@@ -33,5 +35,51 @@ class Options:
         #Penalty for violating soft-constraint
         self.SOFT_CNST_PENALTY = 1e3
          
+        #Parsed input files are snapshotted here, keyed by their contents.
+        #Only used if private to the current user.  None disables the cache
+        self.DATA_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".classe", "cache")
+
         #solver parameters
         self.REL_GAP = 1e-2
+
+        #Check for infeasibility before building, much faster than the solvers' 
+        #conflict refinement (see screening.py)
+        self.SCREEN = True
+
+        #Reduce the model before it reaches the solver, fixing single candidate
+        #courses and dropping the rows they satisfy (see presolve.py)
+        self.PRESOLVE = True
+
+        #Start each solve from the courses' current assignments, if any
+        self.WARM_START = True
+
+        #Decide (course, room class, time) over classes of interchangeable rooms,
+        #then match courses to concrete rooms.  Back2back only keeps the same class
+        self.AGGREGATE_ROOMS = False
+
+        #Solve large terms in two stages.  Times first, against the capacity of 
+        #classes of rooms viable for the same courses.  Then rooms, for each group of 
+        #overlapping times in parallel processes.  None uses one process per cpu
+        self.DECOMPOSE = False
+        self.DECOMPOSE_PROCESSES = None
+
+        #secs of local search of the heuristic schedule (see heuristic.py)
+        #If HEURISTIC_START, each solve without a prior schedule starts from the heuristic
+        self.HEURISTIC_SECONDS = 5.
+        self.HEURISTIC_START = False
+
+        #Re-solve only around courses without an allowed assignment, keeping the rest 
+        #of a prior schedule, for up to LNS_SECONDS.  Neighborhoods are courses 
+        #sharing an "INSTRUCTOR", "DEPT" or "TIME" band.  Ignored if DECOMPOSE
+        self.LNS = False
+        self.LNS_SECONDS = 60.
+        self.LNS_NEIGHBORHOODS = ("INSTRUCTOR", "DEPT", "TIME")
+
+        #One of "CPLEX", "GUROBI" or "CBC" (open-source, requires pulp)
+        #Defaults to $CLASSE_SOLVER if set, else gurobi on windows, cplex elsewhere
+        if os.environ.get("CLASSE_SOLVER"):
+            self.SOLVER = os.environ["CLASSE_SOLVER"]
+        elif "WINDOWS" in system().upper():
+            self.SOLVER = "GUROBI"
+        else:
+            self.SOLVER = "CPLEX"
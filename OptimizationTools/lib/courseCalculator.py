@@ -6,9 +6,14 @@ import config
 import readData
 from helpers import e_cap
 import csv
+import threading
+import itertools
+import multiprocessing
 from numpy import average, array
 from sys import __stdout__ #default logging location  
 import optimizer as opt
+from heuristic import HeuristicScheduler
+import screening
 
 #for the message pasing
 #must use old style for now because old version of wxpython?
@@ -88,6 +93,58 @@ def outputHeatMap(results, time_grid, f_out = __stdout__):
     f_out.write("\n")
 
 
+def weightGrid(scoreWeights, prefWeights, eCapWeights, congWeights, 
+               deptFairnesses, b2bWeights):
+    """All combinations of the given lists of weights, as SESModel.setWeights args.
+    scoreWeights is a list of [1st, 2nd, 3rd] lists"""
+    return list(itertools.product(scoreWeights, prefWeights, eCapWeights, congWeights, 
+                                  deptFairnesses, b2bWeights))
+
+#metric, +1 if larger is better, -1 if smaller is better
+SWEEP_CRITERIA = (("excess_cap", -1), ("max_congestion", -1), 
+                  ("prefs_met", 1), ("min_dept_score", 1))
+
+def flagPareto(rows, criteria=SWEEP_CRITERIA):
+    """Set row["pareto"] for each row of a weight sweep.  True if no other 
+    row is at least as good on all criteria and better on one.  Failed rows are never"""
+    solved = [row for row in rows if row["error"] is None]
+    vals = array([[sign * row[k] for k, sign in criteria] for row in solved])
+    for row in rows:
+        row["pareto"] = False
+    for i, row in enumerate(solved):
+        dominated = (vals >= vals[i]).all(axis=1) & (vals > vals[i]).any(axis=1)
+        row["pareto"] = not dominated.any()
+    return rows
+
+def outputSweep(rows, f_out = __stdout__):
+    """Write the table of a weight sweep, tab delimited"""
+    f_out.write("Score Weights\tPrefs\tExcess Cap\tCongestion\tDept. Fairness\t"
+                "Back to Back\tAvg Excess Cap (%)\tMax Congestion\tPrefs Met\t"
+                "1st Choices\tMin Dept Score\tPareto\n")
+    for row in rows:
+        scoreWeights, prefWeight, eCapWeight, congWeight, deptFairness, b2bWeight = row["weights"]
+        f_out.write("%s\t%s\t%s\t%s\t%s\t%s\t" % (" ".join(map(str, scoreWeights)), 
+                prefWeight, eCapWeight, congWeight, deptFairness, b2bWeight))
+        if row["error"] is not None:
+            f_out.write("Error: %s\n" % row["error"])
+        else:
+            f_out.write("%.1f\t%d\t%d\t%d\t%.3f\t%s\n" % (row["excess_cap"], 
+                    row["max_congestion"], row["prefs_met"], row["first_choices"], 
+                    row["min_dept_score"], "*" if row["pareto"] else ""))
+
+#each worker process of a weight sweep builds its own model once
+_sweep_model = None
+
+def _initSweepWorker(data_paths, config_details):
+    global _sweep_model
+    _sweep_model = SESModel(quiet=True, config_details=config_details)
+    _sweep_model.setData(*data_paths)
+
+def _sweepSolve(weights):
+    try:
+        return _sweep_model.weightMetrics(weights)
+    except Exception as e:
+        return {"weights":weights, "error":str(e)}
 
 class SESModel:
     """Wrapper for the optimization and analysis routines.
@@ -95,27 +152,30 @@ class SESModel:
     Warnings are published under topic "warning"
     Errors are thrown as SESErrors
     """
-    def __init__(self, quiet=False):
-        """Create a new instance."""
+    def __init__(self, quiet=False, config_details=None):
+        """Create a new instance.  
+        config_details is the config.Options of the models, a default one if None"""
         self.optimizer, self.isBuilt = None, False
+        self.worker, self.data_paths = None, None
         self.courses_filt, self.courses, self.roomInventory = None, None, None
         self.prefWeights = [1, 1, 1]
         self.eCapWeight, self.congWeight = 1, 1
-        self.quiet = quiet
+        self.quiet, self.config_details = quiet, config_details
 
     #-------------Creating Assignments
     def setData(self, courses_path, rooms_path, no_conflicts_path, b2b_path):
         """Populate the optimizer"""
         self.isBuilt = False
+        self.data_paths = (courses_path, rooms_path, no_conflicts_path, b2b_path)
         try:
-            self.rooms = readData.importRoomInventory(rooms_path)
-            no_conflicts = readData.importNoConflictGroups(no_conflicts_path)
-            self.courses = readData.importCourses(courses_path, self.rooms)
-            b2b_pairs = readData.importB2BPairs(b2b_path, self.courses)
+            config_details = self.config_details or config.Options()
+            self.rooms, self.courses, no_conflicts, b2b_pairs = readData.importDataset(
+                    courses_path, rooms_path, no_conflicts_path, b2b_path, 
+                    config_details.DATA_CACHE_DIR)
 
             self.optimizer = opt.Optimizer(self.courses, 
                     self.rooms, 
-                    config.Options(), 
+                    config_details, 
                     no_conflicts, 
                     quiet=self.quiet, 
                     b2b_pairs = b2b_pairs)
@@ -132,21 +192,31 @@ class SESModel:
             pub.sendMessage("data_loaded")
 
     def setWeights(self, scoreWeights, prefWeight, 
-                    eCapWeight, congWeight, deptFairness, b2bWeight):
+                    eCapWeight, congWeight, deptFairness, b2bWeight, stabilityWeight=0):
         self.scoreWeights = scoreWeights
         self.eCapWeight, self.congWeight, self.deptFairness = eCapWeight, congWeight, deptFairness
         self.prefWeight = prefWeight
         self.b2bWeight = b2bWeight
+        self.stabilityWeight = stabilityWeight
+
+    def _weights(self):
+        """The args of setWeights, as passed to the optimizer"""
+        return (self.scoreWeights, self.prefWeight, self.eCapWeight, 
+                self.congWeight, self.deptFairness, self.b2bWeight, self.stabilityWeight)
 
     def getScoreWeights(self):
         return self.scoreWeights
 
     def addAssignments(self, path):
-        """Add assignments to the courses"""
+        """Add assignments to the courses.  They are the reference schedule of 
+        the stability weight, and warm start the next optimization"""
         try:
             readData.addAssignments(self.optimizer.getCourses(), 
                                     self.optimizer.getRoomInventory(), 
                                     path)
+            self.optimizer.setReference([(c.assignedRoom, c.assignedTime) 
+                    if c.assignedRoom is not None and c.assignedTime is not None else None
+                    for c in self.optimizer.getCourses()])
 
             pub.sendMessage("update_weights")
     
@@ -164,24 +234,233 @@ class SESModel:
     def optimize(self):
         """Compute Assignments by Optimization"""
         pub.sendMessage("update_weights")
+        if self.optimizer is not None:
+            self.optimizer.resetStop()
+        self._runOptimize(pub.sendMessage)
+
+    def optimizeAsync(self, callAfter=None):
+        """Compute Assignments by Optimization on a worker thread. Returns the thread.
+        Messages are published through callAfter(pub.sendMessage, topic, data),
+        e.g. wx.CallAfter to deliver them on the GUI thread.
+        Use cancelOptimize() to stop early and keep the best solution found."""
+        return self._startWorker(self._runOptimize, callAfter)
+
+    def previewAsync(self, callAfter=None):
+        """Preview on the worker thread, as optimizeAsync.  Returns the thread.
+        cancelOptimize() stops the local search early, keeping its schedule"""
+        return self._startWorker(self._runPreview, callAfter)
+
+    def _startWorker(self, run, callAfter):
+        """Start run(send) on the worker thread, see optimizeAsync"""
+        if self.isOptimizing():
+            raise ses.SESError("Optimization is already running.")
+
+        if callAfter is None:
+            send = pub.sendMessage
+        else:
+            send = lambda topic, data=None: callAfter(pub.sendMessage, topic, data)
+
+        #weights are read from the GUI, so before leaving this thread
+        pub.sendMessage("update_weights")
+        if self.optimizer is not None:
+            self.optimizer.resetStop()
+        self.worker = threading.Thread(target=run, args=(send,))
+        self.worker.daemon = True
+        self.worker.start()
+        return self.worker
+
+    def isOptimizing(self):
+        return self.worker is not None and self.worker.is_alive()
+
+    def cancelOptimize(self):
+        """Stop a running optimization.  Keeps the best solution found so far"""
+        if self.isOptimizing():
+            pub.sendMessage("status_bar", "Cancelling optimization...")
+            self.optimizer.requestStop()
+
+    def reoptimize(self, changed):
+        """Re-solve only around the Courses in changed, e.g. after late edits, keeping 
+        the rest of the current schedule (see OptimizerBase.reoptimize).
+        Solves in full if the weights changed since the last solve"""
+        pub.sendMessage("update_weights")
+        if self.optimizer is not None:
+            self.optimizer.resetStop()
+        self._runOptimize(pub.sendMessage, changed)
+
+    def _runOptimize(self, send, changed=None):
+        """Build if needed and solve, publishing with send(topic, data).
+        Re-solves around changed, a list of Courses, if given or config LNS.  
+        See _lnsMode"""
+        send("optimization_started")
         try:
-            if not self.isBuilt:
-                pub.sendMessage("status_bar", "Building optimization...")
-                self.optimizer.build()
-                self.isBuilt = True
-        
-            pub.sendMessage("status_bar", "Running optimization...")
-            self.optimizer.updateObjFcnAndSolve(self.scoreWeights, self.prefWeight,
-                    self.eCapWeight, self.congWeight, self.deptFairness, self.b2bWeight)
-        except ses.SESError as e:
-            pub.sendMessage("status_bar.error", str(e))
+            #each progress record is published as it arrives
+            self.optimizer.progressCallback = lambda record: send("solver_progress", record)
+            self._build(send)
+
+            #decided before the heuristic fills in a schedule
+            lns = self._lnsMode(changed)
+            if self.optimizer.config.HEURISTIC_START and not lns and not self._hasSchedule():
+                #the solve does not need the warm start
+                try:
+                    self._runHeuristic(send)
+                except ses.SESError as e:
+                    send("warning", "No heuristic start. %s" % e)
+
+            if self.optimizer.stopRequested():
+                raise ses.SESError("Optimization cancelled.")
+            weights = self._weights()
+            solved = True
+            if lns:
+                if not hasattr(self.optimizer, "reoptimize"):
+                    raise ses.SESError("Re-optimization is not supported with DECOMPOSE.")
+                keys = set(c.key for c in changed or [])
+                seeds = [k for k, c in enumerate(self.optimizer.getCourses()) if c.key in keys]
+                send("status_bar", "Re-optimizing around changed courses...")
+                solved = self.optimizer.reoptimize(seeds, *weights) > 0
+            else:
+                send("status_bar", "Running optimization...")
+                self.optimizer.updateObjFcnAndSolve(*weights)
         except Exception as e:
-            pub.sendMessage("status_bar.error", str(e))
+            send("status_bar.error", str(e))
         else:
-            pub.sendMessage("status_bar", "Optimization completed")
-            self.courses = self.optimizer.retrieveAssignment()
-            pub.sendMessage("assignments_calced")
+            if not solved:
+                send("status_bar", "Nothing to re-optimize. Kept the current schedule")
+            elif self.optimizer.stopRequested():
+                send("status_bar", "Optimization cancelled. Kept best solution found")
+            else:
+                send("status_bar", "Optimization completed")
+            if solved:
+                self.courses = self.optimizer.retrieveAssignment()
+            send("assignments_calced")
+        send("optimization_finished")
+
+    def _build(self, send):
+        """Build the optimization if needed, publishing with send(topic, data).
+        With config SCREEN, first checks for infeasibility (see screening.py). 
+        Each problem found is published as a warning, and raises SESError"""
+        if self.isBuilt:
+            return
+        if self.optimizer.config.SCREEN:
+            send("status_bar", "Checking feasibility...")
+            #a decomposed optimizer checks the candidates of its first stage
+            findings = screening.screen(getattr(self.optimizer, "stage1", self.optimizer))
+            for message, courses in findings:
+                send("warning", message)
+            if findings:
+                raise ses.SESError("Infeasible. %s%s" % (findings[0][0], 
+                        " and %d more problems, see warnings" % (len(findings) - 1) 
+                        if len(findings) > 1 else ""))
+
+        send("status_bar", "Building optimization...")
+        self.optimizer.build()
+        self.isBuilt = True
+
+    def preview(self):
+        """Quick schedule by the heuristic, without an exact solve (see heuristic.py).
+        The next optimization starts from it, if config WARM_START"""
+        pub.sendMessage("update_weights")
+        if self.optimizer is not None:
+            self.optimizer.resetStop()
+        self._runPreview(pub.sendMessage)
 
+    def _runPreview(self, send):
+        """Build if needed and assign the heuristic schedule, publishing with send(topic, data)"""
+        send("optimization_started")
+        try:
+            self._build(send)
+            if self.optimizer.stopRequested():
+                raise ses.SESError("Preview cancelled.")
+            heuristic = self._runHeuristic(send)
+        except Exception as e:
+            send("status_bar.error", str(e))
+        else:
+            send("status_bar", "Preview objective %.2f. Optimize for the best schedule" 
+                 % heuristic.objective)
+            send("assignments_calced")
+        send("optimization_finished")
+
+    def _runHeuristic(self, send):
+        """Assign the heuristic schedule of the built optimizer.  
+        Returns the HeuristicScheduler"""
+        send("status_bar", "Running heuristic...")
+        #a decomposed optimizer decides times with its first stage
+        model = getattr(self.optimizer, "stage1", self.optimizer)
+        heuristic = HeuristicScheduler(model)
+        chosen = heuristic.solve(*self._weights(), time_limit=model.config.HEURISTIC_SECONDS)
+        self.courses = model.assignCandidates(chosen)
+        return heuristic
+
+    def _lnsMode(self, changed):
+        """Re-solve around changed if given, or with config LNS around the courses a 
+        prior schedule leaves unassigned.  Not if the weights differ from those of the 
+        last solve, since the rest of the schedule is then no longer worth keeping"""
+        last = self.optimizer.weights
+        if last is not None and tuple(last) <> self._weights():
+            return False
+        if changed is not None:
+            return True
+        assigned = [c.assignedRoom is not None and c.assignedTime is not None 
+                    for c in self.optimizer.getCourses()]
+        return (self.optimizer.config.LNS and not self.optimizer.config.DECOMPOSE and
+                any(assigned) and not all(assigned))
+
+    def _hasSchedule(self):
+        return all(c.assignedRoom is not None and c.assignedTime is not None 
+                    for c in self.optimizer.getCourses())
+
+    #-------------Weight sweeps
+    def weightMetrics(self, weights):
+        """Solve with weights, the args of setWeights, and return a dict of the metrics.
+        Raises SESError if the solve fails"""
+        if self.optimizer is None:
+            raise ses.SESError("No data loaded.")
+        self.setWeights(*weights)
+        self._build(lambda topic, data=None: None)
+        self.optimizer.resetStop()
+        self.optimizer.updateObjFcnAndSolve(*self._weights())
+        self.courses = self.optimizer.retrieveAssignment()
+        self.resetCourses()
+
+        room_prefs, time_prefs = self.prefsStats()
+        return {"weights":weights, "error":None, 
+                "excess_cap":self.summarizeExcessCap(), 
+                "max_congestion":self.maxCongestion(), 
+                "room_prefs":room_prefs, "time_prefs":time_prefs, 
+                "prefs_met":sum(room_prefs[i] + time_prefs[i] for i in (1, 2, 3)), 
+                "first_choices":room_prefs[1] + time_prefs[1], 
+                "min_dept_score":min(self.getDeptFairnessScores(self.scoreWeights).values())}
+
+    def sweepWeights(self, weight_list, processes=None):
+        """Solve for every weights in weight_list in parallel worker processes,
+        each building its own model from the loaded data files.
+        Returns a list of metric dicts (see weightMetrics) in the order of weight_list, 
+        with "error" set for failed solves and "pareto" flagged by flagPareto"""
+        if self.data_paths is None:
+            raise ses.SESError("No data loaded.")
+        pool = multiprocessing.Pool(processes, _initSweepWorker, 
+                                    (self.data_paths, self.config_details))
+        try:
+            rows = pool.map(_sweepSolve, weight_list, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+        return flagPareto(rows)
+
+    def decompositionGap(self):
+        """When optimizing with config DECOMPOSE, solve the current weights with the 
+        monolithic model too.  Returns (decomposed objective, monolithic objective, gap), 
+        see DecomposedOptimizer.monolithicGap"""
+        if self.optimizer is None or not self.optimizer.config.DECOMPOSE:
+            raise ses.SESError("Optimization is not decomposed.  See DECOMPOSE in config.py")
+        obj, mono_obj, gap = self.optimizer.monolithicGap()
+        pub.sendMessage("status_bar", 
+                "Decomposed objective %.4f, monolithic %.4f, gap %.2f%%" % 
+                (obj, mono_obj, 100 * gap))
+        return obj, mono_obj, gap
+
+    def solverProgress(self):
+        """List of (elapsed secs, incumbent, bound, gap, nodes) of the last solve"""
+        return self.optimizer.progress
 
     def exportAssignments(self, path):
         out = csv.writer(open(path, 'wb'), quoting=csv.QUOTE_MINIMAL)
@@ -306,6 +585,22 @@ class SESModel:
  
         return results
  
+    def getDeptFairnessScores(self, scoreWeights):
+        """Return a dictionary {dept:score}, the score of the dept fairness constraint:
+        the avg over the dept's courses of the normalized scoreWeights of the room 
+        and the time choice each got.  See OptimizerBase._fairnessRows"""
+        max_weight = float(max(scoreWeights)) or 1.
+        def score(pref):
+            if 0 < pref <= len(scoreWeights):
+                return scoreWeights[pref - 1] / max_weight
+            return 0.
+
+        scores = {}
+        for c in self.courses:
+            scores.setdefault(c.getDept(), []).append(score(c.gotRoomPref()) + 
+                                                      score(c.gotTimePref()))
+        return dict((dept, average(dept_scores)) for dept, dept_scores in scores.items())
+
     def getDepts(self):
         """Return a list of all the departments 
         ordered alphabetically"""
@@ -0,0 +1,339 @@
+""" Two-stage solve of the SES Optimization Model, for terms too large to solve whole
+
+Stage one decides the times.  It is the usual model, but over classes of rooms
+viable for the same courses (see helpers.roomClasses), so a class holds as many
+courses per time instant as it has rooms.
+Stage two fixes those times and decides the rooms within each class.  The courses
+of a class are matched to its rooms directly, see _matchClass.  Classes linked by
+back2back partners, which should share a room, are solved together as a room MIP 
+over their rooms, in parallel processes.  If the courses of a class cannot be 
+matched to its rooms, which the capacity per instant does not rule out for courses 
+meeting on several days, a single room MIP over every room decides all the rooms.
+
+The schedule need not be optimal for the monolithic model.  Stage one takes the
+excess capacity of the first room of each class and counts a room preference as
+met by any room of its class.  Stage two ignores the dept fairness across classes,
+and the matching need not be optimal within a class.
+See DecomposedOptimizer.monolithicGap.
+"""
+import copy, itertools, multiprocessing
+import numpy as np
+
+import sesClasses as ses
+import helpers
+from candidates import groupBy
+from optimizer import backend
+
+def _classGroups(room_class, partners):
+    """Group the courses of each room class, joining the classes of partners, a list
+    of pairs of course indices.  room_class[k] is the room class of course k.
+    Returns a sorted list of lists of course indices"""
+    parent = dict((r, r) for r in room_class)
+    def find(r):
+        while parent[r] <> r:
+            parent[r] = parent[parent[r]]
+            r = parent[r]
+        return r
+
+    for k1, k2 in partners:
+        parent[find(room_class[k1])] = find(room_class[k2])
+
+    groups = {}
+    for k, r in enumerate(room_class):
+        groups.setdefault(find(r), []).append(k)
+    return sorted(groups.values())
+
+def _matchClass(times, scores):
+    """Rooms, the columns of scores, of the courses at times sharing a room class, 
+    so overlapping courses get different rooms.  scores[k, j] is the objective of 
+    course k in room j, -inf if not allowed.
+    Courses are placed in order of start in their best free room, courses allowed
+    a single room first.  That succeeds if the times meet on the same days, else 
+    the rooms of helpers.matchRooms are given to its groups of courses by score.
+    Then single courses move to better free rooms while any does.
+    Returns the room of each course.  Raises helpers.MatchError if there are none"""
+    n, num_rooms = scores.shape
+    conflicts = [[j for j in xrange(n) if j <> i and times[i].overlap(times[j])] 
+                    for i in xrange(n)]
+    num_allowed = np.isfinite(scores).sum(axis=1)
+    room_of = [None] * n
+    for i in sorted(xrange(n), key=lambda i: (num_allowed[i] > 1, times[i].startMin, 
+                                              -times[i].endMin)):
+        used = set(room_of[j] for j in conflicts[i])
+        free = [j for j in np.argsort(-scores[i], kind="mergesort").tolist() 
+                if j not in used and np.isfinite(scores[i, j])]
+        if not free:
+            room_of = _rankRooms(helpers.matchRooms(times, num_rooms), scores)
+            break
+        room_of[i] = free[0]
+
+    improved = True
+    while improved:
+        improved = False
+        for i in xrange(n):
+            used = set(room_of[j] for j in conflicts[i])
+            best = max((j for j in xrange(num_rooms) if j not in used), 
+                       key=lambda j: scores[i, j])
+            if scores[i, best] > scores[i, room_of[i]]:
+                room_of[i], improved = best, True
+    return room_of
+
+def _rankRooms(colors, scores):
+    """Give each group of courses sharing a color a room, those allowed the fewest
+    rooms first, then those with the best total score.  Returns the room of each course.
+    Raises helpers.MatchError if a group is allowed no room left"""
+    num_rooms = scores.shape[1]
+    totals = np.zeros((num_rooms, num_rooms))
+    for k, color in enumerate(colors):
+        totals[color] += scores[k]
+    room_of_color, taken = {}, set()
+    for color in sorted(set(colors), key=lambda c: (np.isfinite(totals[c]).sum(), 
+                                                    -totals[c].max())):
+        rooms = [j for j in np.argsort(-totals[color], kind="mergesort").tolist() 
+                 if j not in taken and np.isfinite(totals[color, j])]
+        if not rooms:
+            raise helpers.MatchError("Could not give the courses respecting their rooms "
+                                     "their rooms")
+        room_of_color[color] = rooms[0]
+        taken.add(rooms[0])
+    return [room_of_color[color] for color in colors]
+
+def _solveRooms(task):
+    """Stage two MIP for one group of courses.  Returns the room of each course"""
+    (courses, times, roomInventory, config_details, enforceFreeTime, b2b_pairs, 
+     reference, weights) = task
+    optimizer = backend(config_details)(courses, roomInventory, config_details,
+                    enforceFreeTime=enforceFreeTime, quiet=True, b2b_pairs=b2b_pairs)
+    #stage one published the warnings about these courses
+    optimizer.roomWarnings = False
+    optimizer.fixTimes(times)
+    if reference is not None:
+        optimizer.setReference(reference)
+    optimizer.build()
+    optimizer.updateObjFcnAndSolve(*weights)
+    return [c.assignedRoom for c in optimizer.retrieveAssignment()]
+
+class DecomposedOptimizer:
+    """Solves the scheduling optimization in two stages, see the module docstring.
+    Offers the methods of the Optimizer backends that SESModel uses.
+
+    Attributes:
+        stage1 - Optimizer deciding the times
+        monolithic - Optimizer of the whole model, once built by monolithicGap()
+        times, rooms - TimeSlot and room of each course after a solve
+        groups - lists of course indices whose rooms were decided together, those of 
+            a room class or of classes linked by back2back partners
+        mip_groups - indices into groups of those decided by a room MIP
+        reference - None, or the reference schedule.  See OptimizerBase.setReference
+        weights - the args of the last updateObjFcnAndSolve
+        progress, progressCallback - as in OptimizerBase, for stage one
+    """
+    def __init__(self, course_list, roomInventory, configDetails,
+                 noConflictGroups=None, enforceFreeTime=True, quiet=False,
+                 b2b_pairs = []):
+        """NoConflictGroups is a dict {cnst_name: list[ (number, section, classtype)]"""
+        self.course_list, self.roomInventory = course_list, roomInventory
+        self.config = configDetails
+        self.enforceFreeTime = enforceFreeTime
+        self.b2b_pairs = b2b_pairs
+        self._args = (course_list, roomInventory, configDetails, noConflictGroups,
+                      enforceFreeTime, quiet, b2b_pairs)
+        self.stage1 = backend(configDetails)(*self._args)
+        #before screening enumerates the candidates
+        self.stage1.aggregateRooms(helpers.roomClasses(roomInventory, course_list, 
+                                                       coarse=True))
+        self.monolithic, self.reference = None, None
+
+        self.times, self.rooms, self.weights = None, None, None
+        self.groups, self.mip_groups = [], []
+        self.progress, self.progressCallback = [], None
+
+    def build(self):
+        """Build stage one.  Stage two is built for each solve"""
+        self.stage1.build()
+
+    def requestStop(self):
+        """Ask the running solve to stop.  Unlike the backends, a solve stopped
+        before all rooms are decided keeps no solution"""
+        self.stage1.requestStop()
+
+    def stopRequested(self):
+        return self.stage1.stopRequested()
+
+    def resetStop(self):
+        self.stage1.resetStop()
+
+    def writeLP(self, file_name):
+        """Writes the stage one LP to a file"""
+        self.stage1.writeLP(file_name)
+
+    def setReference(self, assignments):
+        """See OptimizerBase.setReference.  Stage one counts a room as kept 
+        by any room of its class"""
+        self.reference = list(assignments)
+        self.stage1.setReference(self.reference)
+        if self.monolithic is not None:
+            self.monolithic.setReference(self.reference)
+
+    def updateObjFcnAndSolve(self, score_weights, pref_weight, e_cap_weight,
+            congestion_weight, dept_fairness, b2b_weight, stability_weight=0):
+        """choiceweights should be in order [1st choice, 2nd choice, etc]"""
+        self.weights = (score_weights, pref_weight, e_cap_weight,
+                        congestion_weight, dept_fairness, b2b_weight, stability_weight)
+        self.stage1.progressCallback = self.progressCallback
+        self.stage1.updateObjFcnAndSolve(*self.weights)
+        self.progress = self.stage1.progress
+        times = self.stage1.chosenTimes()
+        room_class = self.stage1.chosenRooms()
+
+        #back2back partners should share a room, so their classes are solved together
+        cands = self.stage1.cands
+        pairs = [(k1, k2, (c1_tuple, c2_tuple)) for c1_tuple, c2_tuple in self.b2b_pairs
+                    for k1 in cands.coursesMatching(*c1_tuple)
+                    for k2 in cands.coursesMatching(*c2_tuple)]
+        groups = _classGroups(room_class, [(k1, k2) for k1, k2, pair in pairs])
+        group_of = {}
+        for ix, group in enumerate(groups):
+            for k in group:
+                group_of[k] = ix
+        group_pairs = [[] for group in groups]
+        for k1, k2, pair in pairs:
+            group_pairs[group_of[k1]].append(pair)
+
+        rooms = [None] * len(self.course_list)
+        try:
+            for group in groups:
+                self._matchGroup(group, times, room_class, rooms)
+        except helpers.MatchError:
+            groups, mip_groups = [range(len(self.course_list))], [0]
+            tasks = [self._roomTask(groups[0], times, self.b2b_pairs, self.roomInventory)]
+        else:
+            mip_groups = [ix for ix, group_b2b in enumerate(group_pairs) if group_b2b]
+            tasks = [self._roomTask(groups[ix], times, group_pairs[ix], 
+                                    self._groupRooms(groups[ix], room_class)) 
+                        for ix in mip_groups]
+        processes = self.config.DECOMPOSE_PROCESSES
+        pool = None
+        #daemonic processes, e.g. the workers of SESModel.sweepWeights, cannot have children
+        if processes == 1 or len(tasks) <= 1 or multiprocessing.current_process().daemon:
+            results = itertools.imap(_solveRooms, tasks)
+        else:
+            pool = multiprocessing.Pool(processes)
+            results = pool.imap(_solveRooms, tasks)
+
+        #rooms come back as copies from the worker processes
+        room_lookup = dict((r, r) for r in self.roomInventory)
+        room_lookup.update((r, r) for c in self.course_list for r in c.roomPrefs)
+        try:
+            for ix, group_rooms in itertools.izip(mip_groups, results):
+                for k, room in zip(groups[ix], group_rooms):
+                    rooms[k] = room_lookup.get(room, room)
+                if self.stopRequested():
+                    raise ses.SESError("Optimization cancelled before all rooms were assigned.")
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        self.times, self.rooms = times, rooms
+        self.groups, self.mip_groups = groups, mip_groups
+
+    def _matchGroup(self, group, times, room_class, rooms):
+        """Set rooms[k] of the courses k in group by matching the courses of each 
+        room class to its rooms, see _matchClass.  Raises helpers.MatchError"""
+        cands = self.stage1.cands
+        for r, ks in groupBy(np.asarray(room_class)[group], np.asarray(group)):
+            ks, members = ks.tolist(), cands.roomMembers(r)
+            if len(members) == 1:
+                for k in ks:
+                    rooms[k] = members[0]
+                continue
+            room_ix = _matchClass([times[k] for k in ks], self._roomScores(ks, members))
+            for k, j in zip(ks, room_ix):
+                rooms[k] = members[j]
+
+    def _roomScores(self, ks, rooms):
+        """Matrix over the courses ks and rooms of the room dependent part of the 
+        objective, see OptimizerBase._objCoefs, up to their common normalization.
+        -inf where a course respects another room"""
+        (score_weights, pref_weight, e_cap_weight, cong, fairness, b2b_weight, 
+         stability_weight) = self.weights
+        score_weights = self.stage1._normalizeScoreWeights(score_weights)
+        pref_weight = max(pref_weight, self.config.EPS_SAFETY_OVERRIDE)
+        scores = np.zeros((len(ks), len(rooms)))
+        for i, k in enumerate(ks):
+            c = self.course_list[k]
+            for j, room in enumerate(rooms):
+                if c.respectRoom and room <> c.roomPrefs[0]:
+                    scores[i, j] = -np.inf
+                    continue
+                hits = [w for w, pref in zip(score_weights, c.roomPrefs) if pref == room]
+                scores[i, j] = pref_weight * sum(hits) - e_cap_weight * helpers.e_cap(c, room)
+                if self.reference is not None and self.reference[k] is not None:
+                    scores[i, j] -= stability_weight * (self.reference[k][0] <> room) / 2.
+        return scores
+
+    def _groupRooms(self, group, room_class):
+        """The inventory rooms of the room classes of the courses in group"""
+        cands = self.stage1.cands
+        classes = sorted(set(room_class[k] for k in group))
+        return [room for r in classes if r < len(cands.room_classes) 
+                for room in cands.roomMembers(r)]
+
+    def _roomTask(self, group, times, b2b_pairs, roomInventory):
+        """Args of _solveRooms for the courses in group, over the rooms roomInventory.
+        Times are fixed, so congestion and dept fairness are dropped.  Preferences, 
+        excess capacity and stability are normalized by the number of courses, so are 
+        scaled to keep their weight relative to back2back"""
+        (score_weights, pref_weight, e_cap_weight, cong, fairness, b2b_weight, 
+         stability_weight) = self.weights
+        frac = len(group) / float(len(self.course_list))
+        config_details = copy.copy(self.config)
+        config_details.EPS_SAFETY_OVERRIDE *= frac
+        weights = (score_weights, pref_weight * frac, e_cap_weight * frac, 0, 0, b2b_weight, 
+                   stability_weight * frac)
+        reference = None
+        if self.reference is not None:
+            reference = [self.reference[k] for k in group]
+        return ([self.course_list[k] for k in group], [times[k] for k in group],
+                roomInventory, config_details, self.enforceFreeTime, b2b_pairs, 
+                reference, weights)
+
+    def retrieveAssignment(self):
+        """Return a course list with the correct assignments"""
+        if self.rooms is None:
+            raise ses.SESError("Optimizer has not been solved yet.")
+        for c, room, ts in zip(self.course_list, self.rooms, self.times):
+            c.addAssignment(room, ts, testViable=False)
+        return self.course_list
+
+    def monolithicGap(self):
+        """Solve the last weights with the monolithic model as well, warm started
+        from the courses' assignments.  Returns (objective of the decomposed schedule,
+        monolithic objective, relative gap), both measured by the monolithic model"""
+        if self.rooms is None:
+            raise ses.SESError("Optimizer has not been solved yet.")
+        if self.monolithic is None:
+            self.monolithic = backend(self.config)(*self._args)
+            if self.reference is not None:
+                self.monolithic.setReference(self.reference)
+            self.monolithic.build()
+
+        obj = self.monolithic.scheduleObjective(zip(self.rooms, self.times), *self.weights)
+        self.monolithic.progressCallback = self.progressCallback
+        self.monolithic.updateObjFcnAndSolve(*self.weights)
+        mono_obj = self.monolithic.objectiveValue(*self.weights)
+        return obj, mono_obj, (mono_obj - obj) / max(abs(mono_obj), 1e-10)
+
+    def getMaxCong(self):
+        return self.stage1.getMaxCong()
+
+    #these allow handles on internal data
+    def getCourses(self):
+        return self.course_list
+
+    def getRoomInventory(self):
+        return self.roomInventory
+
+    def getDepts(self):
+        return self.stage1.getDepts()
@@ -2,6 +2,7 @@
 import sesClasses as ses
 import datetime as dt
 import config, itertools
+import numpy as np
 from wx.lib.pubsub import Publisher as pub
 
 
@@ -12,38 +13,208 @@ time2str = ses.TimeSlot.time2str
 #these are needed for the function main()
 import readData
 
-def allowedRooms(course, roomInventory):
+def roomViability(courses, roomInventory):
+    """Boolean matrix whose [k, j] entry is courses[k].isViableRoom(roomInventory[j]).
+    Capacities are compared as arrays and AV equipment as packed bitmasks."""
+    capacity = np.array([r.capacity for r in roomInventory], dtype=float)
+    enrollment = np.array([c.enrollment for c in courses], dtype=float)
+    hard_cap = np.array([c.hasHardCap() for c in courses], dtype=bool)
+    fits = np.where(hard_cap[:, None], 
+                    capacity[None, :] >= enrollment[:, None],
+                    enrollment[:, None] <= (1 + ses.Course.SOFT_CAPACITY) * capacity[None, :])
+
+    #one bit per AV item mentioned by any room or course
+    items = {}
+    for av in [r.AV for r in roomInventory] + [c.av_requirements for c in courses]:
+        for item in av:
+            items.setdefault(item, len(items))
+
+    def bitmasks(av_lists):
+        has = np.zeros((len(av_lists), len(items)), dtype=bool)
+        for i, av in enumerate(av_lists):
+            has[i, [items[item] for item in av]] = True
+        return np.packbits(has, axis=1)
+    
+    room_av = bitmasks([r.AV for r in roomInventory])
+    course_av = bitmasks([c.av_requirements for c in courses])
+    missing_av = (course_av[:, None, :] & ~room_av[None, :, :]).any(axis=2)
+    return fits & ~missing_av
+
+def roomClasses(roomInventory, courses, coarse=False):
+    """Group interchangeable rooms, i.e. same capacity, AV and floor.  
+    Rooms any course requests as a preference are kept as singletons.
+    If coarse, group rooms on the same floor that are viable for the same courses, 
+    even though capacities differ.  Only rooms several courses must respect are 
+    kept as singletons, a single such course can always be given its room.
+    Returns a list of lists of rooms, ordered by their first member in roomInventory"""
+    if coarse:
+        viable = roomViability(courses, roomInventory)
+        num_fixed = {}
+        for c in courses:
+            if c.respectRoom:
+                num_fixed[c.roomPrefs[0]] = num_fixed.get(c.roomPrefs[0], 0) + 1
+        pref_rooms = set(r for r, num in num_fixed.items() if num > 1)
+    else:
+        pref_rooms = set(r for c in courses for r in c.roomPrefs)
+    classes, lookup = [], {}
+    for j, r in enumerate(roomInventory):
+        if r in pref_rooms:
+            classes.append([r])
+            continue
+        if coarse:
+            key = (viable[:, j].tobytes(), r.bldg, r.roomNum[:1])
+        else:
+            key = (r.capacity, frozenset(r.AV), r.bldg, r.roomNum[:1])
+        if key not in lookup:
+            lookup[key] = len(classes)
+            classes.append([])
+        classes[lookup[key]].append(r)
+    return classes
+
+class MatchError(ses.SESError):
+    """Raised by matchRooms when the times cannot be matched to the rooms"""
+    pass
+
+def matchRooms(times, num_rooms, partners={}):
+    """Match each of times (TimeSlots) to one of num_rooms interchangeable rooms so 
+    overlapping times get different rooms.  partners[i] lists the j whose room i 
+    should share if possible, e.g. back2back.  
+    Times are placed greedily in order of start, which always succeeds if they meet 
+    on the same days.  A time meeting on several days keeps its room on all of them, 
+    so otherwise, unless more times meet at some instant than there are rooms, 
+    the overlapping times are searched exhaustively, see _searchRooms.
+    Returns the room index of each time.  Raises MatchError only if no matching exists"""
+    n = len(times)
+    conflicts = [[j for j in xrange(n) if j <> i and times[i].overlap(times[j])] 
+                    for i in xrange(n)]
+    room_of = [None] * n
+    for i in sorted(xrange(n), key=lambda i: (times[i].startMin, -times[i].endMin)):
+        used = set(room_of[j] for j in conflicts[i])
+        preferred = [room_of[j] for j in partners.get(i, []) if room_of[j] is not None]
+        free = [r for r in preferred + range(num_rooms) if r not in used]
+        if not free:
+            break
+        room_of[i] = free[0]
+    else:
+        return room_of
+
+    if _maxLoad(times) > num_rooms:
+        raise MatchError("More than %d of %d times meet at once" % (num_rooms, n))
+    room_of = [None] * n
+    for component in _components(conflicts):
+        if not _searchRooms(component, conflicts, num_rooms, partners, room_of):
+            raise MatchError("Could not match %d overlapping times to %d rooms" % 
+                                (len(component), num_rooms))
+    return room_of
+
+def _maxLoad(times):
+    """Most of times meeting at a single instant, the start of one of them"""
+    halves = [["H1", "H2"] if t.half.isFull() else [t.half.half] for t in times]
+    load = 0
+    for t, t_halves in zip(times, halves):
+        for half in t_halves:
+            for day in t.days:
+                load = max(load, sum(1 for u, u_halves in zip(times, halves) 
+                                     if half in u_halves and day in u.days and 
+                                        u.startTime <= t.startTime < u.endTime))
+    return load
+
+def _components(conflicts):
+    """Connected components of the graph with adjacency lists conflicts"""
+    seen, components = set(), []
+    for i in xrange(len(conflicts)):
+        if i in seen:
+            continue
+        seen.add(i)
+        component, stack = [], [i]
+        while stack:
+            j = stack.pop()
+            component.append(j)
+            for k in conflicts[j]:
+                if k not in seen:
+                    seen.add(k)
+                    stack.append(k)
+        components.append(component)
+    return components
+
+def _searchRooms(nodes, conflicts, num_rooms, partners, room_of):
+    """Depth first search for the rooms of nodes, a component of conflicts, 
+    setting room_of.  Returns False if there are none.
+    Places next the time with the fewest rooms left, so failures show early, and
+    backtracks as soon as a time has none left.  Rooms no time of the component
+    uses yet are interchangeable, so only one of them is tried"""
+    free = dict((i, set(xrange(num_rooms))) for i in nodes)
+    opened = []
+
+    def search(left):
+        if not left:
+            return True
+        i = min(left, key=lambda i: (len(free[i]), -len(conflicts[i])))
+        preferred = [room_of[j] for j in partners.get(i, []) if room_of[j] is not None]
+        fresh = [r for r in preferred + range(num_rooms) if r not in opened][:1]
+        rooms = [r for r in preferred + opened + fresh if r in free[i]]
+        left.remove(i)
+        for r in sorted(set(rooms), key=rooms.index):
+            room_of[i] = r
+            if r in fresh:
+                opened.append(r)
+            taken = [j for j in conflicts[i] if j in left and r in free[j]]
+            for j in taken:
+                free[j].remove(r)
+            if all(free[j] for j in taken) and search(left):
+                return True
+            for j in taken:
+                free[j].add(r)
+            if r in fresh:
+                opened.pop()
+        room_of[i] = None
+        left.add(i)
+        return False
+
+    return search(set(nodes))
+
+def allowedRooms(course, roomInventory, viable=None, warn=True):
     """Return a list of permissible rooms for this course.
     If asked to respect room, will always return that room.
     Othewise, only return viable rooms.  
+    viable is this course's row of roomViability(), computed if not given.
+    Unless warn is False, room preferences not returned are published as warnings.
     """
     if course.respectRoom:
         return [course.roomPrefs[0]]
 
-    viable_rooms = filter(lambda r: course.isViableRoom(r), roomInventory)
+    if viable is None:
+        viable = roomViability([course], roomInventory)[0]
+    viable_rooms = [roomInventory[j] for j in np.flatnonzero(viable)]
     for r in course.roomPrefs:
-        if r not in viable_rooms:
+        if warn and r not in viable_rooms:
             pub.sendMessage("warning", 
                     "Room Pref %s not used for course %s because inviable or not in inventory" % 
                     (r, course) )
     
     return viable_rooms
     
-#VG: change this to look for forbiddentimeSlots inside config_details
-def allowedTimes(course, config_details, forbiddenTimeSlot = None):
-    """Return a list of allowed TimeSlots for this course.
-        Args:
-        course - course instance
-        forbiddenTimeSlot - No TimeSlot meets OVERLAP with this 1 time slot
+#viable slots by signature.  see _timeSignature
+_viable_times, _parsed_times = {}, {}
 
-        If asked ot respect time, always return that time.
-        Otherwise, will add preferred times even if deemed inviable (with warning)
-    """
-    if course.respectTime:
-        return [course.timePrefs[0]]
-    
-    #Figure out how many times it meets
+def _str2timeCached(s):
+    if s not in _parsed_times:
+        _parsed_times[s] = str2time(s)
+    return _parsed_times[s]
+
+def _timeSignature(course, config_details, forbiddenTimeSlot):
+    """Everything that determines the generated slots of a course.  
+    Includes the relevant config options so edits to them invalidate the cache."""
     ts = course.timePrefs[0]
+    late_rec = course.isRec() and ts.days[0] in ("W", "Th", "F")
+    early_sem = ts.startTime < _str2timeCached(config_details.FIRST_SEMINAR)
+    return (ts.half.half, ts.meetingsPerWk(), ts.sessionLength(), late_rec, early_sem, 
+            forbiddenTimeSlot, tuple(config_details.SLOAN_BLOCKS), 
+            config_details.FIRST_SEMINAR, config_details.LAST_CLASS)
+
+def _genTimes(ts, late_rec, config_details, forbiddenTimeSlot):
+    """Generate the viable slots for courses shaped like ts"""
+    #Figure out how many times it meets
     no_meetings_wk = ts.meetingsPerWk()        
     days = []
     if no_meetings_wk == 3:
@@ -52,19 +223,14 @@ def allowedTimes(course, config_details, forbiddenTimeSlot = None):
         days = ("M W", "T Th")
     elif no_meetings_wk == 1:
         #if its a recitation requesting last half week, honor it
-        if course.isRec() and ts.days[0] in ("W", "Th", "F"):
+        if late_rec:
             days = ("W", "Th", "F")
         else:
             days = ses.TimeSlot.daysOfWeek
-    else: #no_meetings_wk >= 4:
-        raise ses.SESError("Course %s meets more than 3X/wk" % course )
 
     #figure out for how long it meets
     session_length = ts.sessionLength()
     half_hour = dt.timedelta(minutes=30)
-    if session_length < half_hour:
-        raise ValueError(
-        "Course %s meets for less than 30 min per session" % course)
 
     starts = []
     if session_length == dt.timedelta(hours=1, minutes=30):
@@ -89,7 +255,7 @@ def allowedTimes(course, config_details, forbiddenTimeSlot = None):
             earliest_time += half_hour
     
     #put everything together
-    ts_from_start = lambda s, d: ses.TimeSlot(ts.half, d, s, 
+    ts_from_start = lambda s, d: ses.TimeSlot.interned(ts.half, d, s, 
                     s + session_length) 
     viable_ts = [ts_from_start(s, d) for (s,d) in itertools.product(starts, days)]
             
@@ -98,6 +264,35 @@ def allowedTimes(course, config_details, forbiddenTimeSlot = None):
         assert isinstance(forbiddenTimeSlot, ses.TimeSlot)
         viable_ts = filter(lambda t: not t.overlap(forbiddenTimeSlot), viable_ts)    
 
+    return viable_ts
+
+#VG: change this to look for forbiddentimeSlots inside config_details
+def allowedTimes(course, config_details, forbiddenTimeSlot = None):
+    """Return a list of allowed TimeSlots for this course.
+        Args:
+        course - course instance
+        forbiddenTimeSlot - No TimeSlot meets OVERLAP with this 1 time slot
+
+        If asked ot respect time, always return that time.
+        Otherwise, will add preferred times even if deemed inviable (with warning)
+        Generated slots are shared by all courses with the same _timeSignature.
+    """
+    if course.respectTime:
+        return [course.timePrefs[0]]
+    
+    ts = course.timePrefs[0]
+    if ts.meetingsPerWk() >= 4:
+        raise ses.SESError("Course %s meets more than 3X/wk" % course )
+
+    if ts.sessionLength() < dt.timedelta(minutes=30):
+        raise ValueError(
+        "Course %s meets for less than 30 min per session" % course)
+
+    key = _timeSignature(course, config_details, forbiddenTimeSlot)
+    if key not in _viable_times:
+        _viable_times[key] = _genTimes(ts, key[3], config_details, forbiddenTimeSlot)
+    viable_ts = list(_viable_times[key])
+
     #add the preferences back just incase they aren't in there
     #potentially violates forbidden times
     #ideally throw a warning here instead of adding back directly
@@ -109,9 +304,11 @@ def allowedTimes(course, config_details, forbiddenTimeSlot = None):
     
     return viable_ts
 
-def allowedRoomTimes(course, config_details, roomInventory, forbiddenTimeSlots):
-    """Returns a list of allowed (room, Timeslots) for this course."""
-    rooms = allowedRooms(course, roomInventory)
+def allowedRoomTimes(course, config_details, roomInventory, forbiddenTimeSlots, 
+                        viable=None, warn=True):
+    """Returns a list of allowed (room, Timeslots) for this course.
+    viable and warn are as in allowedRooms"""
+    rooms = allowedRooms(course, roomInventory, viable, warn)
     times = allowedTimes(course, config_details, forbiddenTimeSlots)
 
     if not rooms or not times:
@@ -131,7 +328,7 @@ def genAllTimeSlots(config_options, excludeFreeTime=True):
         for d in ses.TimeSlot.daysOfWeek:
             startTime = str2time(config_options.FIRST_CLASS)
             while startTime < str2time(config_options.LAST_CLASS):
-                ts = ses.TimeSlot(half, d, startTime, startTime + halfhour)
+                ts = ses.TimeSlot.interned(half, d, startTime, startTime + halfhour)
                 if not excludeFreeTime or not config_options.FREE_TIME.overlap(ts):
                     times.append(ts)
                 startTime += halfhour
@@ -0,0 +1,372 @@
+""" Greedy and local search heuristic for the SES Optimization Model
+
+Finds a good schedule in seconds, e.g. to preview a choice of weights or to warm
+start the exact solve.  It searches the candidates of a built Optimizer, so it
+keeps the allowed (room, time)s of helpers.allowedRoomTimes and the hard
+constraints of the model.  These are read off the rows of the model:
+    packing rows, at most rhs of some candidates - rooms, instructors,
+        lecture-recitations and no-conflict groups
+    implication rows, a candidate needs one of some others - breakouts
+They are the rows before presolve, and candidates presolve fixed to 0 are skipped.
+The objective is the Optimizer's.  Back2back, congestion and dept fairness are
+valued as the solver would given the chosen candidates.
+
+Courses are placed most constrained first, a breakout together with its lecture.
+A course with no room left bumps the courses blocking its least blocked candidate.
+Local search then moves single courses to their best candidate, or into a candidate
+held by a few other courses that move elsewhere, until no move improves.
+"""
+import time
+import numpy as np
+
+import sesClasses as ses
+
+def _invert(rows, cols, num_cols):
+    """(ptr, rows) so the rows of column j are rows[ptr[j]:ptr[j+1]]"""
+    order = np.argsort(cols, kind="mergesort")
+    return np.searchsorted(cols[order], np.arange(num_cols + 1)), rows[order]
+
+def _expand(ptr, data, idx):
+    """For indices idx, parallel arrays (position in idx, item) with one entry
+    for every item of data[ptr[i]:ptr[i+1]]"""
+    starts = ptr[idx]
+    counts = ptr[idx + 1] - starts
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return (np.repeat(np.arange(len(idx)), counts),
+            data[np.repeat(starts, counts) + offsets])
+
+class HeuristicScheduler:
+    """Greedy construction then local search over the candidates of a built Optimizer.
+
+    Attributes:
+        optimizer - the Optimizer, after build()
+        chosen - candidate of each course in the schedule, -1 if not placed
+        objective - objective value of the schedule, as measured by the Optimizer
+        moves - number of improving local search moves of the last solve
+    """
+    #placements that bump other courses, per course, before giving up
+    MAX_EJECTIONS = 10
+
+    #candidates held by other courses a move may try, per course, 
+    #and how many courses may hold it
+    MAX_SWAPS, MAX_BUMPED = 3, 2
+
+    def __init__(self, optimizer):
+        self.optimizer = optimizer
+        cands = self.cands = optimizer.cands
+        n = len(cands)
+        #the rows before presolve, whose patterns are known
+        indptr, cols, coefs, sense, rhs = optimizer.full_rows
+        num_rows = len(indptr) - 1
+        length = np.diff(indptr)
+        row_of = np.repeat(np.arange(num_rows), length)
+        sense, rhs = np.array(sense), np.asarray(rhs)
+        self.allowed = optimizer.model_ub[:n] > 0
+
+        def count(mask):
+            return np.bincount(row_of[mask], minlength=num_rows)
+        off_cands, ones, minus = count(cols >= n), count(coefs == 1), count(coefs == -1)
+        packing = (sense == "L") & (off_cands == 0) & (ones == length)
+        implies = ((sense == "G") & (rhs == 0) & (off_cands == 0) & (minus == 1) &
+                   (ones == length - 1))
+        congestion = count(cols == optimizer.maxCongVar) > 0
+
+        #packing rows by row and by candidate
+        in_pack = packing[row_of]
+        pack_id = np.cumsum(packing) - 1
+        self.cap = rhs[packing]
+        self.pack_ptr = np.concatenate(([0], np.cumsum(length[packing])))
+        self.pack_cols = cols[in_pack]
+        self.cand_pack_ptr, self.cand_pack = _invert(pack_id[row_of[in_pack]],
+                                                     cols[in_pack], n)
+
+        #implication rows.  The dependent candidate needs one of the supports
+        imp_id = np.cumsum(implies) - 1
+        dep, sup = implies[row_of] & (coefs == -1), implies[row_of] & (coefs == 1)
+        self.imp_ptr = np.concatenate(([0], np.cumsum(length[implies] - 1)))
+        self.imp_supports = cols[sup]
+        self.cand_imp_ptr, self.cand_imp = _invert(imp_id[row_of[dep]], cols[dep], n)
+
+        #time instants of the congestion rows
+        in_cong = congestion[row_of] & (cols < n)
+        self.num_instants = congestion.sum()
+        self.cand_inst_ptr, self.cand_inst = _invert((np.cumsum(congestion) - 1)[row_of[in_cong]],
+                                                     cols[in_cong], n)
+
+        #back2back indicators, valued 1 if their first candidate and one of the others is chosen
+        links = optimizer.b2b_links
+        self.link_first = np.array([i for i, c2 in links], dtype=int)
+        link_lens = [len(c2) for i, c2 in links]
+        link_c2 = np.concatenate([c2 for i, c2 in links] + [np.zeros(0, dtype=int)]).astype(int)
+        self.first_ptr, self.first_links = _invert(np.arange(len(links)), self.link_first, n)
+        self.c2_ptr, self.c2_links = _invert(np.repeat(np.arange(len(links)), link_lens),
+                                             link_c2, n)
+
+        #breakouts are placed with the lectures that support them
+        self.lectures_of, self.breakouts_of = {}, {}
+        dep_courses = cands.course_ix[cols[dep]]
+        for kb, r in zip(dep_courses.tolist(), imp_id[row_of[dep]].tolist()):
+            sups = self.imp_supports[self.imp_ptr[r]:self.imp_ptr[r + 1]]
+            self.lectures_of.setdefault(kb, set()).update(cands.course_ix[sups].tolist())
+        for kb, lecs in self.lectures_of.items():
+            for k in lecs:
+                self.breakouts_of.setdefault(k, []).append(kb)
+        self.chosen = -np.ones(len(optimizer.course_list), dtype=int)
+
+    def _setWeights(self, score_weights, pref_weight, e_cap_weight,
+                    congestion_weight, dept_fairness, b2b_weight, stability_weight=0):
+        """Objective pieces of the candidates, as in OptimizerBase._objCoefs"""
+        optimizer, n = self.optimizer, len(self.cands)
+        score_weights = optimizer._normalizeScoreWeights(score_weights)
+        obj_coefs = optimizer._objCoefs(score_weights, pref_weight, e_cap_weight,
+                                        congestion_weight, dept_fairness, b2b_weight, 
+                                        stability_weight)
+        self.lin = obj_coefs[:n]
+        self.link_coef = obj_coefs[np.array(optimizer.b2b_vars, dtype=int)]
+        self.cong_weight = -obj_coefs[optimizer.maxCongVar]
+        self.fair_weight = obj_coefs[optimizer.minDept]
+
+        rows, cols, coefs = optimizer._fairnessRows(score_weights)
+        on_cands = cols < n
+        self.fair_score = np.zeros(n)
+        self.fair_score[cols[on_cands]] = coefs[on_cands]
+        self.dept_of = optimizer.dept_ix
+
+    def _reset(self):
+        """Start from an empty schedule"""
+        self.chosen[:] = -1
+        self.is_chosen = np.zeros(len(self.cands), dtype=bool)
+        self.used = np.zeros(len(self.cap))
+        self.inst_count = np.zeros(self.num_instants)
+        self.dept_score = np.zeros(len(self.optimizer.dept_size))
+        self.link_count = np.zeros(len(self.link_first))
+
+    def _assign(self, k, j, sign=1):
+        """Place course k at candidate j.  sign=-1 removes it"""
+        self.chosen[k] = j if sign > 0 else -1
+        self.is_chosen[j] = sign > 0
+        self.used[self.cand_pack[self.cand_pack_ptr[j]:self.cand_pack_ptr[j + 1]]] += sign
+        self.inst_count[self.cand_inst[self.cand_inst_ptr[j]:self.cand_inst_ptr[j + 1]]] += sign
+        self.link_count[self.c2_links[self.c2_ptr[j]:self.c2_ptr[j + 1]]] += sign
+        self.dept_score[self.dept_of[k]] += sign * self.fair_score[j]
+
+    def _remove(self, k):
+        self._assign(k, self.chosen[k], -1)
+
+    def _supported(self, j):
+        """Whether every implication row of candidate j has a chosen support"""
+        for r in self.cand_imp[self.cand_imp_ptr[j]:self.cand_imp_ptr[j + 1]].tolist():
+            if not self.is_chosen[self.imp_supports[self.imp_ptr[r]:self.imp_ptr[r + 1]]].any():
+                return False
+        return True
+
+    def _scores(self, k):
+        """For the unplaced course k, its candidates and the objective of placing it
+        at each, -inf where infeasible"""
+        idx = self.cands.candidatesOfCourse(k)
+        ok = self.allowed[idx].copy()
+        pos, rows = _expand(self.cand_pack_ptr, self.cand_pack, idx)
+        ok[pos[self.used[rows] >= self.cap[rows]]] = False
+        pos, imps = _expand(self.cand_imp_ptr, self.cand_imp, idx)
+        for p in np.unique(pos).tolist():
+            ok[p] = ok[p] and self._supported(idx[p])
+
+        #placed breakouts must keep a supporting lecture
+        for kb in self.breakouts_of.get(k, []):
+            j = self.chosen[kb]
+            if j < 0:
+                continue
+            for r in self.cand_imp[self.cand_imp_ptr[j]:self.cand_imp_ptr[j + 1]].tolist():
+                sups = self.imp_supports[self.imp_ptr[r]:self.imp_ptr[r + 1]]
+                if not self.is_chosen[sups].any():
+                    in_sups = np.zeros(len(self.cands), dtype=bool)
+                    in_sups[sups] = True
+                    ok &= in_sups[idx]
+
+        score = self.lin[idx].copy()
+        pos, links = _expand(self.first_ptr, self.first_links, idx)
+        np.add.at(score, pos, self.link_coef[links] * (self.link_count[links] > 0))
+        pos, links = _expand(self.c2_ptr, self.c2_links, idx)
+        gain = self.is_chosen[self.link_first[links]] & (self.link_count[links] == 0)
+        np.add.at(score, pos, self.link_coef[links] * gain)
+
+        if self.cong_weight and self.num_instants:
+            peak = np.zeros(len(idx))
+            pos, inst = _expand(self.cand_inst_ptr, self.cand_inst, idx)
+            np.maximum.at(peak, pos, self.inst_count[inst] + 1)
+            score -= self.cong_weight * np.maximum(peak, self.inst_count.max())
+        if self.fair_weight:
+            d = self.dept_of[k]
+            others = self.dept_score.copy()
+            others[d] = np.inf
+            score += self.fair_weight * np.minimum(others.min(),
+                                                   self.dept_score[d] + self.fair_score[idx])
+        score[~ok] = -np.inf
+        return idx, score
+
+    def _objective(self):
+        """Objective value of the current schedule"""
+        obj = self.lin[self.chosen[self.chosen >= 0]].sum()
+        obj += self.link_coef[self.is_chosen[self.link_first] & (self.link_count > 0)].sum()
+        if self.num_instants:
+            obj -= self.cong_weight * self.inst_count.max()
+        return obj + self.fair_weight * self.dept_score.min()
+
+    def _blockers(self, j):
+        """Courses holding the full packing rows of candidate j"""
+        rows = self.cand_pack[self.cand_pack_ptr[j]:self.cand_pack_ptr[j + 1]]
+        rows = rows[self.used[rows] >= self.cap[rows]]
+        pos, members = _expand(self.pack_ptr, self.pack_cols, rows)
+        return set(self.cands.course_ix[members[self.is_chosen[members]]].tolist())
+
+    def _root(self, k):
+        """The lecture a breakout is placed with, else k"""
+        lecs = self.lectures_of.get(k)
+        return min(lecs) if lecs else k
+
+    def _bundle(self, k):
+        """Course k and the breakouts placed with it"""
+        return [k] + self.breakouts_of.get(k, [])
+
+    def _place(self, k):
+        """Place course k at its best candidate, along with its breakouts.
+        Returns False, leaving k unplaced, if there is none"""
+        idx, score = self._scores(k)
+        order = np.argsort(-score, kind="mergesort")
+        for pos in order[np.isfinite(score[order])].tolist():
+            self._assign(k, idx[pos])
+            placed = []
+            for kb in self.breakouts_of.get(k, []):
+                if self.chosen[kb] >= 0 or (self.chosen[list(self.lectures_of[kb])] < 0).any():
+                    continue
+                idx_b, score_b = self._scores(kb)
+                if not np.isfinite(score_b.max()):
+                    break
+                self._assign(kb, idx_b[score_b.argmax()])
+                placed.append(kb)
+            else:
+                return True
+
+            for kb in placed + [k]:
+                self._remove(kb)
+        return False
+
+    def _stopped(self, deadline):
+        return time.time() > deadline or self.optimizer.stopRequested()
+
+    def _construct(self, rng, deadline):
+        """Greedy schedule.  Raises SESError if some course cannot be placed, or the 
+        deadline passes or a stop of the optimizer is requested before all are"""
+        sizes = np.diff(self.cands.course_ptr)
+        roots = [k for k in xrange(len(self.chosen)) if self._root(k) == k]
+        queue = sorted(roots, key=lambda k: (sizes[k], k))
+        ejections = self.MAX_EJECTIONS * len(self.chosen)
+        while queue:
+            if self._stopped(deadline):
+                raise ses.SESError("Heuristic stopped before placing every course.")
+            k = queue.pop(0)
+            if self.chosen[k] >= 0 or self._place(k):
+                continue
+            #bump the courses blocking the least blocked candidate
+            idx = self.cands.candidatesOfCourse(k)
+            idx = idx[self.allowed[idx]]
+            blockers = [set(self._root(k2) for k2 in self._blockers(j)) - set([k])
+                            for j in idx.tolist()]
+            fewest = min(len(b) for b in blockers)
+            if ejections <= 0 or fewest == 0:
+                raise ses.SESError("Heuristic could not place course %s." %
+                                   self.optimizer.course_list[k])
+            choices = [b for b in blockers if len(b) == fewest]
+            bumped = choices[rng.randint(len(choices))]
+            for k2 in bumped:
+                for kb in self._bundle(k2):
+                    if self.chosen[kb] >= 0:
+                        self._remove(kb)
+            ejections -= len(bumped)
+            queue = [k] + sorted(bumped) + queue
+
+    def _improve(self, deadline):
+        """Local search until no move improves, the deadline passes or a stop of the 
+        optimizer is requested.  Returns the number of improving moves"""
+        moves, improved = 0, True
+        while improved and not self._stopped(deadline):
+            improved = False
+            for k in np.argsort(np.diff(self.cands.course_ptr), kind="mergesort").tolist():
+                if self._stopped(deadline):
+                    break
+
+                #move k to its best candidate
+                current = self.chosen[k]
+                self._remove(k)
+                idx, score = self._scores(k)
+                old = score[idx == current][0]
+                best = score.argmax()
+                if score[best] > old + 1e-9:
+                    self._assign(k, idx[best])
+                    moves, improved = moves + 1, True
+                    continue
+                self._assign(k, current)
+                if self._swap(k, idx, score):
+                    moves, improved = moves + 1, True
+        return moves
+
+    def _swap(self, k, idx, score):
+        """Move k into a better candidate held by at most MAX_BUMPED other courses, 
+        which then move to their best remaining candidates.  
+        Returns True if the objective improves.  Only courses without breakouts move"""
+        if self.breakouts_of.get(k) or self._root(k) <> k:
+            return False
+        #held by other courses, and better for k than its own
+        held = np.isneginf(score) & self.allowed[idx]
+        gains = self.lin[idx] > self.lin[self.chosen[k]]
+        better = np.nonzero(held & gains)[0]
+        better = better[np.argsort(-self.lin[idx[better]], kind="mergesort")]
+        tries = 0
+        for j in idx[better].tolist():
+            if tries >= self.MAX_SWAPS:
+                break
+            if not self._supported(j):
+                continue
+            bumped = sorted(self._blockers(j) - set([k]))
+            if not bumped or len(bumped) > self.MAX_BUMPED or any(
+                    self.breakouts_of.get(k2) or self._root(k2) <> k2 for k2 in bumped):
+                continue
+
+            tries += 1
+            before = self._objective()
+            old = [(k2, self.chosen[k2]) for k2 in [k] + bumped]
+            for k2, j2 in old:
+                self._remove(k2)
+            idx_k, score_k = self._scores(k)
+            if np.isfinite(score_k[idx_k == j][0]):
+                self._assign(k, j)
+                for k2 in bumped:
+                    idx2, score2 = self._scores(k2)
+                    if not np.isfinite(score2.max()):
+                        break
+                    self._assign(k2, idx2[score2.argmax()])
+                else:
+                    if self._objective() > before + 1e-9:
+                        return True
+
+            for k2, j2 in old:
+                if self.chosen[k2] >= 0:
+                    self._remove(k2)
+            for k2, j2 in old:
+                self._assign(k2, j2)
+        return False
+
+    def solve(self, score_weights, pref_weight, e_cap_weight, congestion_weight, 
+              dept_fairness, b2b_weight, stability_weight=0, time_limit=None, seed=0):
+        """Build a schedule greedily, then improve it for at most time_limit secs.
+        Returns the chosen candidate of each course, see OptimizerBase.assignCandidates.
+        Raises SESError if the greedy schedule cannot place some course, or does not
+        within time_limit"""
+        deadline = np.inf if time_limit is None else time.time() + time_limit
+        self._setWeights(score_weights, pref_weight, e_cap_weight,
+                         congestion_weight, dept_fairness, b2b_weight, stability_weight)
+        self._reset()
+        self._construct(np.random.RandomState(seed), deadline)
+        self.moves = self._improve(deadline)
+        self.objective = self._objective()
+        return self.chosen.copy()
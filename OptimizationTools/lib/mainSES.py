@@ -10,7 +10,7 @@ from readData import importCourses, importRoomInventory, importNoConflictGroups,
 import config
 import helpers
 from numpy import average
-import sys
+import sys, csv
 
 # def getDeptScores(courses, optimizer, prefWeights):
 #         all_depts = optimizer.getDepts()
@@ -63,6 +63,8 @@ def main():
 
     print "\n \n Max Cong:\t%d" % optimizer.getMaxCong()
     courses = optimizer.retrieveAssignment()
+    if config_details.DECOMPOSE:
+        print "Decomposed %f \t Monolithic %f \t Gap %f" % optimizer.monolithicGap()
 
     courses_with_break = set([c.number + c.section for c in courses if c.isBreakout()] )
 
@@ -125,6 +127,30 @@ def main():
 #     for c in courses_no_times:
 #         print c
     
+def sweep():
+    """Solve for every row of a weights file in parallel.  Prints the metrics table"""
+    if len(sys.argv) not in (7, 8):
+        print "Inputs sweep -roompath -courses_path - noConflict_path - back2back_path - weights_path [-processes]"
+        print "weights_path is a csv with columns Score1, Score2, Score3, Prefs, ExcessCap, Congestion, DeptFairness, B2B"
+        sys.exit()
+
+    room_path, courses_path, groups_path, b2b_path, weights_path = tuple(sys.argv[2:7])
+    processes = int(sys.argv[7]) if len(sys.argv) == 8 else None
+
+    weight_list = []
+    for d in csv.DictReader(open(weights_path, 'rU')):
+        weight_list.append(([float(d["Score1"]), float(d["Score2"]), float(d["Score3"])], 
+                float(d["Prefs"]), float(d["ExcessCap"]), float(d["Congestion"]), 
+                float(d["DeptFairness"]), float(d["B2B"])))
+
+    model = cc.SESModel(quiet=True)
+    model.setData(courses_path, room_path, groups_path, b2b_path)
+    rows = model.sweepWeights(weight_list, processes)
+    cc.outputSweep(rows)
+
 
 if __name__ == '__main__':
-    main()
+    if sys.argv[1:2] == ["sweep"]:
+        sweep()
+    else:
+        main()
@@ -1,8 +1,25 @@
-"""Handles the platform specific import of hte optimizer"""
+"""Handles the import of the optimizer backend named in config.Options.SOLVER"""
 
-## Import platform specific model
-from platform import system
-if "WINDOWS" in system().upper():
-    from optimizer_gurobi import * #uses gurobi, for windows
-else:
-    from optimizer_cplex import * #uses cplex, for mac osx
+def backend(configDetails):
+    """The Optimizer class of the backend in configDetails.SOLVER.
+    Backends are imported lazily, so only the selected solver need be installed."""
+    solver = configDetails.SOLVER.strip().upper()
+    if solver == "CPLEX":
+        from optimizer_cplex import Optimizer as _Optimizer
+    elif solver == "GUROBI":
+        from optimizer_gurobi import Optimizer as _Optimizer
+    elif solver == "CBC":
+        from optimizer_cbc import Optimizer as _Optimizer  #open-source, via pulp
+    else:
+        raise ValueError("Unrecognized solver %s. Must be one of 'CPLEX', 'GUROBI', 'CBC'"
+                % configDetails.SOLVER)
+    return _Optimizer
+
+def Optimizer(course_list, roomInventory, configDetails, *args, **kwargs):
+    """Create an Optimizer using the backend in configDetails.SOLVER.
+    If configDetails.DECOMPOSE, a decomposition.DecomposedOptimizer over that backend"""
+    if configDetails.DECOMPOSE:
+        from decomposition import DecomposedOptimizer
+        return DecomposedOptimizer(course_list, roomInventory, configDetails, *args, **kwargs)
+
+    return backend(configDetails)(course_list, roomInventory, configDetails, *args, **kwargs)
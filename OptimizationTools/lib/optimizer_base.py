@@ -0,0 +1,811 @@
+""" Solver independent construction of the SES Optimization Model
+
+Every constraint family emits its rows into one sparse matrix, which the
+backends (optimizer_cplex, optimizer_gurobi, optimizer_cbc) hand to their
+solver in a single bulk call rather than one api call per row or variable.
+"""
+import threading, time, copy
+import numpy as np
+
+import sesClasses as ses
+import helpers
+from candidates import CandidateTable, groupBy
+from presolve import presolve
+
+class OptimizerBase:
+    """Builds the scheduling optimization as a sparse matrix.
+
+    Backends implement _loadModel(), _solutionValues(), writeLP(),
+    addDeptFairnessConstraints() and updateObjFcnAndSolve(), 
+    and _updateBounds() if the solver keeps its own copy of the bounds.
+    A running solve stops, keeping its incumbent, once requestStop() is called
+    from any thread.  Backends report progress through _recordProgress().
+
+    Attributes:
+        cands - CandidateTable.  Candidate i is column i
+        b2b_vars - column indices of the back2back indicators
+        b2b_links - for each back2back indicator, (course 1 candidate, course 2 candidates) 
+            it links
+        fixed_times - None, or the TimeSlot (or None) each course is fixed to.  See fixTimes
+        reference - None, or the (room, TimeSlot) (or None) of each course in the 
+            reference schedule.  See setReference
+        weights - the args of the last updateObjFcnAndSolve, or None
+        roomWarnings - if False, the room preferences left unused are not published,
+            e.g. by models deciding again the rooms of another
+        maxCongVar - column index of the maximum congestion
+        minDept - column index of the minimal dept score
+        progress - list of (elapsed secs, incumbent, bound, gap, nodes) of the last solve.
+            incumbent and gap are None until a solution is found
+        progressCallback - None or function called with each new progress record
+        col_names, col_binary, col_lb, col_ub - column data
+        row_names, row_sense, row_rhs - row data.  sense is one of 'L', 'G', 'E'
+        A_indptr, A_indices, A_data - the constraint matrix in CSR form after build()
+            These are the rows handed to the solver, so are reduced if config.PRESOLVE
+        full_rows - (A_indptr, A_indices, A_data, row_sense, row_rhs) before presolve
+        model_lb, model_ub - column bounds after presolve.  col_lb, col_ub may be
+            tightened further, see fixOutside
+        course_list
+        roomInventory
+    """
+    #secs between progress records when only the node count changes
+    PROGRESS_INTERVAL = 1.
+
+    #kinds of neighborhood, see neighborhood()
+    LNS_KINDS = ("INSTRUCTOR", "DEPT", "TIME")
+
+    def __init__(self, course_list, roomInventory, configDetails,
+                 noConflictGroups=None, enforceFreeTime=True, quiet=False,
+                 b2b_pairs = []):
+        """NoConflictGroups is a dict {cnst_name: list[ (number, section, classtype)]"""
+        self.course_list, self.roomInventory = course_list, roomInventory
+        self.config = configDetails
+        self.enforceFreeTime = bool(enforceFreeTime)
+        self.noConflictGroups = noConflictGroups
+        self.b2b_pairs = b2b_pairs
+        self.quiet = quiet
+
+        #candidate i is column i
+        room_classes = None
+        if configDetails.AGGREGATE_ROOMS:
+            room_classes = helpers.roomClasses(roomInventory, course_list)
+        self.cands = CandidateTable(course_list, roomInventory, room_classes)
+        self.fixed_times = None
+        self.reference, self.obj_moves = None, None
+        self.weights = None
+        self.model_lb = self.model_ub = None
+        self.roomWarnings = True
+
+        #column data
+        self.col_names, self.col_binary, self.col_lb, self.col_ub = [], [], [], []
+
+        #rows, kept as a list of (cols, coefs) arrays until build() assembles them
+        self._row_cols, self._row_coefs = [], []
+        self.row_names, self.row_sense, self.row_rhs = [], [], []
+
+        #Speed efficiency
+        self.vars_by_time = np.zeros(0, dtype=int)
+        self.b2b_vars, self.b2b_links = [], []
+
+        #gen time slots excluding free time for safety
+        self.allTimeSlots = helpers.genAllTimeSlots(configDetails, False)
+
+        #set from another thread to cancel a solve
+        self._stop = threading.Event()
+
+        self.progress, self.progressCallback = [], None
+        self._solve_start = time.time()
+
+    def _addVars(self, names, binary=True, lb=0., ub=None):
+        """Add columns and return their indices"""
+        if ub is None:
+            ub = 1. if binary else np.inf
+        first = len(self.col_names)
+        self.col_names += names
+        self.col_binary += [binary] * len(names)
+        self.col_lb += [lb] * len(names)
+        self.col_ub += [ub] * len(names)
+        return range(first, len(self.col_names))
+
+    def _addVar(self, name, binary=True, lb=0., ub=None):
+        """Add a column and return its index"""
+        return self._addVars([name], binary, lb, ub)[0]
+
+    def _addConstr(self, cols, coefs, sense, rhs, name):
+        """Add the row sum(coefs * cols) (sense) rhs.  sense is one of 'L', 'G', 'E'"""
+        self._row_cols.append(np.asarray(cols, dtype=np.int32))
+        self._row_coefs.append(np.asarray(coefs, dtype=float))
+        self.row_sense.append(sense)
+        self.row_rhs.append(float(rhs))
+        self.row_names.append(name)
+
+    def aggregateRooms(self, room_classes):
+        """Decide over room_classes, lists of inventory rooms, instead of rooms.  
+        See helpers.roomClasses.  Call before build()"""
+        self.cands = CandidateTable(self.course_list, self.roomInventory, room_classes)
+
+    def fixTimes(self, times):
+        """Only allow course k at times[k], a TimeSlot, or any time if times[k] is None.
+        Call before build()"""
+        self.fixed_times = list(times)
+
+    def setReference(self, assignments):
+        """Penalize moving courses away from assignments, the (room, TimeSlot) or None
+        of each course, e.g. a published schedule.  See stability_weight of _objCoefs"""
+        self.reference, self.obj_moves = list(assignments), None
+
+    def _genCandidates(self, forbiddenTimes):
+        """Enumerate the candidates, unless already done"""
+        if self.cands.room_viable is not None:
+            return
+        self.cands.genCandidates(self.config, forbiddenTimes, self.roomWarnings)
+        if self.fixed_times is not None:
+            self.cands.keepTimes(self.fixed_times)
+
+    def prepareCandidates(self):
+        """Enumerate the candidates before build(), e.g. to screen the model.  
+        See screening.py"""
+        self._genCandidates(self.config.FREE_TIME if self.enforceFreeTime else None)
+
+    def genBinaries(self, forbiddenTimes):
+        """Create and store the z(s,r,c) and assignment constraint
+           'Every course has 1 room-time'"""
+        #add a binary variable for each course, room, time triplet
+        #binaries are added first, so candidate i is column i
+        self._genCandidates(forbiddenTimes)
+        self._addVars(["%s %s %s" % self.cands.candidate(i) for i in xrange(len(self.cands))])
+
+        for ix, course in enumerate(self.course_list):
+            course_vars = self.cands.candidatesOfCourse(ix)
+            self._addConstr(course_vars, np.ones(len(course_vars)), "E", 1.0,
+                            "1 Room-Time %s" % course)
+
+    def addBack2Back(self, course_pairs):
+        """Add variables and constraints for back2back teaching
+        Each pair in course_pairs will be encouraged by to be back-2-back"""
+        cands = self.cands
+        pairs = [(cands.candidatesOfCourses(cands.coursesMatching(*c1_tuple)),
+                  cands.candidatesOfCourses(cands.coursesMatching(*c2_tuple)), c2_tuple)
+                    for c1_tuple, c2_tuple in course_pairs]
+        used = np.concatenate([np.zeros(0, dtype=int)] +
+                              [np.concatenate((c1_vars, c2_vars)) for c1_vars, c2_vars, c2 in pairs])
+        adjacent = cands.slotAdjacency(cands.ts_ix[used])
+
+        for c1_vars, c2_vars, c2_tuple in pairs:
+            #index the course 2 variables by room
+            c2_by_room = dict(groupBy(cands.room_ix[c2_vars], c2_vars))
+            no_vars = np.zeros(0, dtype=int)
+
+            for indx1 in c1_vars.tolist():
+                c1, r1, ts1 = cands.candidate(indx1)
+                #find the course 2 variables that are neighboring and same room
+                room_vars = c2_by_room.get(cands.room_ix[indx1], no_vars)
+                c2_indices = room_vars[adjacent[cands.ts_ix[indx1],
+                                                cands.ts_ix[room_vars]]].tolist()
+
+                #add a binary if c1 is back 2 back to c2 and c1 is at t1 in r1
+                b2b_indx = self._addVar("Back2Back_%s_%s_%s" % (c1, " ".join(c2_tuple), ts1))
+                self.b2b_vars.append(b2b_indx)
+                self.b2b_links.append((indx1, c2_indices))
+
+                #Add constraints: z_b2b <= c1_var
+                self._addConstr([indx1, b2b_indx], [-1., 1.], "L", 0.,
+                                "B2B_typeA %s %s %s" % (c1, ts1, r1))
+
+                #add Constraints z_b2b <= sum( neighboring c2_vars )
+                self._addConstr([b2b_indx] + c2_indices, [1.] + [-1.] * len(c2_indices),
+                                "L", 0.,
+                                "B2B_typeB %s %s %s %s" % (c1, ts1, r1, " ".join(c2_tuple)))
+
+    def _updateVarsByTime(self, time_slot):
+        """Find all variables that overlap given timeslot"""
+        #read from the index built in build()
+        self.vars_by_time = self.cands.atInstant(time_slot)
+
+    #With some cleverness, might add fewer constraints here...
+    def atMostOneCourseConstraints(self, time_instant):
+        """Add constraint: At Given time_instant, a room has at most one course.
+        A class of aggregated rooms has at most as many courses as rooms"""
+        self._updateVarsByTime(time_instant)
+        idx = self.vars_by_time
+        for r, room_vars in groupBy(self.cands.room_ix[idx], idx):
+            size = self.cands.room_size[r]
+            if len(room_vars) <= size:
+                continue
+            if size == 1:
+                self._addConstr(room_vars, np.ones(len(room_vars)), "L", 1.0,
+                        "Time %s: At most 1 course in room %s" % (time_instant,
+                                                                  self.cands.rooms[r]))
+            else:
+                self._addConstr(room_vars, np.ones(len(room_vars)), "L", float(size),
+                        "Time %s: At most %d courses in room class %s" % (time_instant, 
+                                                            size, self.cands.rooms[r]))
+
+    def instructorConstraints(self, time_instant):
+        """At given time, at most 1 course per instructor"""
+        self._updateVarsByTime(time_instant)
+        profs, idx = self.cands.expandInstructors(self.vars_by_time)
+        for prof, prof_vars in groupBy(profs, idx):
+            if len(prof_vars) > 1:
+                self._addConstr(prof_vars, np.ones(len(prof_vars)), "L", 1.0,
+                        "Prof %s %s" % (self.cands.instructors[prof], time_instant))
+
+    def lectureRecitationConstraints(self, time_instant):
+        """Recitations cannot conflict with each other, or with their lectures"""
+        self._updateVarsByTime(time_instant)
+        cands, idx = self.cands, self.vars_by_time
+        courses = cands.course_ix[idx]
+
+        #Don't add breakout rooms.
+        #These will be constrained to be at same time as lectures anyway,
+        #so will not conflict.  If we add them here though, constraint invalid
+        not_breakout = ~cands.is_breakout[courses]
+        idx, courses = idx[not_breakout], courses[not_breakout]
+        courses_with_rec = set(cands.lecrec_ix[courses[cands.is_rec[courses]]])
+
+        for sCourse, course_vars in groupBy(cands.lecrec_ix[courses], idx):
+            if sCourse not in courses_with_rec:
+                continue
+            c = cands.courses[cands.course_ix[course_vars[0]]]
+            self._addConstr(course_vars, np.ones(len(course_vars)), "L", 1.0,
+                            "Time: %s Lec-Rec %s" % (time_instant, c.number + c.section))
+
+    #coding relies on fact that not too many breakouts
+    def breakOutConstraints(self, time_instant):
+        """Breakouts meet simultaneously to Lectures, same floor"""
+        self._updateVarsByTime(time_instant)
+        cands, idx = self.cands, self.vars_by_time
+        courses = cands.course_ix[idx]
+        not_rec = ~cands.is_rec[courses]
+        idx, courses = idx[not_rec], courses[not_rec]
+        is_breakout = cands.is_breakout[courses]
+
+        #Divide the lecture variables by (number + section, TimeSlot, floor)
+        lecs = {}
+        for v in idx[~is_breakout].tolist():
+            key = (cands.lecrec_ix[cands.course_ix[v]], cands.ts_ix[v],
+                   cands.room_floor[cands.room_ix[v]])
+            lecs.setdefault(key, []).append(v)
+
+        for v_b in idx[is_breakout].tolist():
+            #find all lectures with same time-block and floor
+            #if the lecture has a fixed time, it may not occur in this time_instant
+            #checks for whether all breakouts have partners occur earlier
+            key = (cands.lecrec_ix[cands.course_ix[v_b]], cands.ts_ix[v_b],
+                   cands.room_floor[cands.room_ix[v_b]])
+            lec_vars_filt = lecs.get(key, [])
+            c_b, r_b, ts_b = cands.candidate(v_b)
+
+            #Constraint: if choose this breakout, must choose one lecture
+            self._addConstr(lec_vars_filt + [v_b], [1.0] * len(lec_vars_filt) + [-1.0],
+                            "G", 0.0,
+                            "Lec-Breakout %s TimeSlot %s Room %s" % (c_b, ts_b, r_b))
+
+    def maxCongestionConstraint(self, time_instant):
+        """Add a variable and constraint for maxCongestion"""
+        self._updateVarsByTime(time_instant)
+        vars_only = self.vars_by_time.tolist()
+        self._addConstr(vars_only + [self.maxCongVar], [1.0] * len(vars_only) + [-1.0],
+                        "L", 0.0, "MaxCong %s" % time_instant)
+
+    def addAllNoConflictGroups(self, time_instant):
+        """Add constraints for each group of classes that cannot conflict."""
+        if self.noConflictGroups is None:
+            return
+
+        self._updateVarsByTime(time_instant)
+        courses = self.cands.course_ix[self.vars_by_time]
+        for cnst_name, in_group in self.no_conflict_masks:
+            vars_only = self.vars_by_time[in_group[courses]]
+            if len(vars_only) > 1:
+                self._addConstr(vars_only, np.ones(len(vars_only)), "L", 1.0,
+                                ("Time: %s" + cnst_name) % time_instant)
+
+    def build(self):
+        """Build the optimization model and load it into the solver"""
+        if self.enforceFreeTime:
+            self.genBinaries(self.config.FREE_TIME)
+        else:
+            self.genBinaries(None)
+
+        #one-time index of the candidates occupying each time instant
+        self.cands.indexInstants(self.allTimeSlots)
+
+        #Make list of course names for each group
+        self.no_conflict_masks = []
+        for cnst_name, course_nums in (self.noConflictGroups or {}).items():
+            names = [" ".join([num, sec, type]) for num, sec, type in course_nums]
+            self.no_conflict_masks.append((cnst_name, self.cands.coursesNamed(names)))
+
+        self.addBack2Back(self.b2b_pairs)
+
+        self.maxCongVar = self._addVar("MaxCong", binary=False)
+        self.minDept = self._addVar("minDept", binary=False)
+
+        for its in self.allTimeSlots:
+            self.atMostOneCourseConstraints(its)
+            self.instructorConstraints(its)
+            self.lectureRecitationConstraints(its)
+            self.breakOutConstraints(its)
+            self.maxCongestionConstraint(its)
+            self.addAllNoConflictGroups(its)
+
+        #assemble the rows into one CSR matrix
+        self.A_indptr = np.cumsum([0] + [len(c) for c in self._row_cols])
+        self.A_indices = np.concatenate(self._row_cols + [np.zeros(0, dtype=np.int32)])
+        self.A_data = np.concatenate(self._row_coefs + [np.zeros(0)])
+        self._row_cols, self._row_coefs = [], []
+        self.col_binary = np.array(self.col_binary, dtype=bool)
+        self.col_lb, self.col_ub = np.array(self.col_lb), np.array(self.col_ub)
+        self.row_rhs = np.array(self.row_rhs)
+        self.full_rows = (self.A_indptr, self.A_indices, self.A_data, 
+                          self.row_sense, self.row_rhs)
+        if self.config.PRESOLVE:
+            (self.A_indptr, self.A_indices, self.A_data, self.row_sense, self.row_rhs, 
+                kept) = presolve(*self.full_rows + (self.col_lb, self.col_ub, self.row_names))
+            self.row_names = [self.row_names[r] for r in kept.tolist()]
+        self.model_lb, self.model_ub = self.col_lb.copy(), self.col_ub.copy()
+
+        self._loadModel()
+        self._objComponents()
+
+        #don't bother adding fairness constraints yet
+        #will add right before optimization
+
+    def requestStop(self):
+        """Ask the running solve to stop and keep the best solution found so far"""
+        self._stop.set()
+
+    def stopRequested(self):
+        return self._stop.is_set()
+
+    def resetStop(self):
+        self._stop.clear()
+
+    def _startProgress(self):
+        """Clear the progress history at the start of a solve"""
+        self.progress, self._solve_start = [], time.time()
+
+    def _recordProgress(self, incumbent, bound, nodes, force=False):
+        """Record (elapsed, incumbent, bound, gap, nodes) of the running solve.
+        Unless forced, records at most every PROGRESS_INTERVAL secs
+        when nothing but the node count changed"""
+        elapsed = time.time() - self._solve_start
+        if self.progress and not force:
+            last_elapsed, last_incumbent, last_bound = self.progress[-1][:3]
+            if ((incumbent, bound) == (last_incumbent, last_bound) and 
+                    elapsed - last_elapsed < self.PROGRESS_INTERVAL):
+                return
+
+        gap = None
+        if incumbent is not None:
+            gap = abs(bound - incumbent) / max(abs(incumbent), 1e-10)
+        record = (elapsed, incumbent, bound, gap, nodes)
+        self.progress.append(record)
+        if self.progressCallback is not None:
+            self.progressCallback(record)
+
+    def numRows(self):
+        return len(self.row_names)
+
+    def numCols(self):
+        return len(self.col_names)
+
+    def rowSlices(self):
+        """(cols, coefs) arrays of each row of the constraint matrix"""
+        breaks = self.A_indptr[1:-1]
+        return zip(np.split(self.A_indices, breaks), np.split(self.A_data, breaks))
+
+    def _normalizeScoreWeights(self, score_weights):
+        """Scale so the largest score weight is 1"""
+        max_weight = float(max(score_weights))
+        if max_weight == 0:
+            max_weight = 1.
+        return [w/max_weight for w in score_weights]
+
+    def _objComponents(self):
+        """Per candidate pieces of the objective, fixed once the model is built"""
+        self.obj_ecap = self.cands.excessCapacity()
+        self.obj_choices = self.cands.choiceHits()
+        self.obj_day_penalty = np.where(self.cands.onPreferredDays(), 0., 
+                                        -self.config.SOFT_CNST_PENALTY)
+
+        #dept of every course, and num courses for each dept
+        depts = self.getDepts()
+        row_of_dept = dict(zip(depts, range(len(depts))))
+        self.dept_ix = np.array([row_of_dept[c.getDept()] for c in self.course_list], 
+                                dtype=int)
+        self.dept_size = np.bincount(self.dept_ix, minlength=len(depts)).astype(float)
+
+    def _choiceScores(self, choice_weights):
+        """Preference score of every candidate, sum of choice_weights of the choices it meets"""
+        weights = np.zeros(len(self.obj_choices))
+        num = min(len(weights), len(choice_weights))
+        weights[:num] = choice_weights[:num]
+        return np.dot(weights, self.obj_choices)
+
+    def _moves(self):
+        """Per candidate, the number of the room and the time of the reference
+        schedule it changes, 0 to 2"""
+        if self.obj_moves is None:
+            same_room, same_time = self.cands.keepsAssignments(self.reference)
+            has_ref = np.array([a is not None for a in self.reference], dtype=bool)
+            self.obj_moves = np.where(has_ref[self.cands.course_ix], 
+                                      2. - same_room - same_time, 0.)
+        return self.obj_moves
+
+    def _objCoefs(self, score_weights, pref_weight, e_cap_weight,
+                  congestion_weight, dept_fairness, b2b_weight, stability_weight=0):
+        """Objective coefficient of every column, to be maximized.
+        score_weights should already be normalized.
+        stability_weight penalizes the changes of room and of time from the
+        reference schedule, if any"""
+        pref_weight = max(pref_weight, self.config.EPS_SAFETY_OVERRIDE)
+
+        #normalize weights to make comparable
+        e_cap_weight /= float(-len(self.course_list))
+        pref_weight /= float(len(self.course_list))
+
+        obj_coefs = np.zeros(self.numCols())
+        obj_coefs[:len(self.cands)] = (self._choiceScores(score_weights) * pref_weight + 
+                                       self.obj_ecap * e_cap_weight + self.obj_day_penalty)
+        obj_coefs[self.maxCongVar] = -congestion_weight
+        obj_coefs[self.minDept] = dept_fairness
+
+        #VG better performance if we don't normalize b2b_weight
+        obj_coefs[self.b2b_vars] = b2b_weight
+
+        #normalized like prefs, half for the room and half for the time
+        if stability_weight and self.reference is not None:
+            obj_coefs[:len(self.cands)] -= (self._moves() * stability_weight / 
+                                            (2. * len(self.course_list)))
+        return obj_coefs
+
+    def _fairnessRows(self, choice_weights):
+        """The rows sum(coefs * vars) - minDept >= 0, one per dept in getDepts() order,
+        as COO triplets (rows, cols, coefs).
+        rows and cols are the same for all choice_weights, so backends can update
+        the coefficients in place.  Some coefs may be zero."""
+        scores = self._choiceScores(choice_weights)
+        cols = np.nonzero(self.obj_choices.any(axis=0))[0]
+        rows = self.dept_ix[self.cands.course_ix[cols]]
+        coefs = scores[cols] / self.dept_size[rows]
+
+        num_depts = len(self.dept_size)
+        rows = np.concatenate((rows, np.arange(num_depts)))
+        cols = np.concatenate((cols, [self.minDept] * num_depts))
+        coefs = np.concatenate((coefs, -np.ones(num_depts)))
+        return rows, cols, coefs
+
+    def _fairnessSlices(self, choice_weights):
+        """(cols, coefs) arrays of each fairness row, in getDepts() order"""
+        rows, cols, coefs = self._fairnessRows(choice_weights)
+        order = np.argsort(rows, kind="mergesort")
+        breaks = np.searchsorted(rows[order], np.arange(1, len(self.dept_size)))
+        return [(cols[ix], coefs[ix]) for ix in np.split(order, breaks)]
+
+    def mipStart(self):
+        """Partial solution (cols, values) from the courses' current assignments,
+        i.e. the last retrieveAssignment() or an "Add Assignments" load.
+        Courses without an allowed assignment are left to the solver.
+        Returns None if there is nothing to start from."""
+        if not self.config.WARM_START:
+            return None
+
+        cols, values = [], []
+        for k, indx in enumerate(self._assignedCandidates().tolist()):
+            if indx < 0:
+                continue
+            course_vars = self.cands.candidatesOfCourse(k)
+            cols += course_vars.tolist()
+            values += (course_vars == indx).astype(float).tolist()
+
+        if not cols:
+            return None
+        return cols, values
+
+    def _assignedCandidates(self):
+        """Candidate index of each course's current assignment, -1 if it has none allowed.
+        After build(), candidates presolve fixed to 0 are not allowed"""
+        indices = []
+        for k, c in enumerate(self.course_list):
+            indx = None
+            if c.assignedRoom is not None and c.assignedTime is not None:
+                indx = self.cands.candidateOf(k, c.assignedRoom, c.assignedTime)
+            if indx is not None and self.model_ub is not None and not self.model_ub[indx]:
+                indx = None
+            indices.append(-1 if indx is None else indx)
+        return np.array(indices, dtype=int)
+
+    #-------------Large neighborhood search
+    def _updateBounds(self, cols):
+        """Pass the new col_lb, col_ub of cols to the solver.
+        Nothing to do for backends handed the bounds on every solve"""
+        pass
+
+    def fixOutside(self, free):
+        """Fix every course not in free, a list of course indices, to its current 
+        assignment through the bounds of its candidates.  Courses without an allowed
+        assignment stay free.  free=None frees every course.  Call after build()"""
+        num_cands = len(self.cands)
+        lb, ub = self.model_lb[:num_cands].copy(), self.model_ub[:num_cands].copy()
+        if free is not None:
+            assigned = self._assignedCandidates()
+            fixed = assigned >= 0
+            fixed[list(free)] = False
+            for k in np.nonzero(fixed)[0].tolist():
+                ub[self.cands.candidatesOfCourse(k)] = 0.
+                lb[assigned[k]] = ub[assigned[k]] = 1.
+
+        changed = np.nonzero((lb != self.col_lb[:num_cands]) | 
+                             (ub != self.col_ub[:num_cands]))[0]
+        self.col_lb[:num_cands], self.col_ub[:num_cands] = lb, ub
+        if len(changed):
+            self._updateBounds(changed)
+
+    def _courseTimes(self, k):
+        """TimeSlots of the kth course for the time band: its assigned time, 
+        or its time prefs if unassigned"""
+        c = self.course_list[k]
+        return [c.assignedTime] if c.assignedTime is not None else c.timePrefs
+
+    def neighborhood(self, seeds, kind):
+        """Sorted indices of the seeds, a list of course indices, and the courses 
+        sharing an instructor with a seed (kind "INSTRUCTOR"), a dept (kind "DEPT") 
+        or overlapping the time of a seed (kind "TIME").  See _courseTimes"""
+        courses, near = self.course_list, set(seeds)
+        if kind == "INSTRUCTOR":
+            profs = set(p for k in seeds for p in courses[k].getInstructors())
+            near.update(k for k, c in enumerate(courses) 
+                            if profs.intersection(c.getInstructors()))
+        elif kind == "DEPT":
+            depts = set(courses[k].dept for k in seeds)
+            near.update(k for k, c in enumerate(courses) if c.dept in depts)
+        elif kind == "TIME":
+            band = set(ts for k in seeds for ts in self._courseTimes(k))
+            near.update(k for k in xrange(len(courses)) 
+                            if any(ts.overlap(ts2) for ts in self._courseTimes(k) 
+                                                    for ts2 in band))
+        else:
+            raise ValueError("Unrecognized neighborhood %s. Must be one of %s" % 
+                                (kind, ", ".join(self.LNS_KINDS)))
+        return sorted(near)
+
+    def _pinned(self, free, assigned):
+        """Whether fixing every course outside free leaves nothing to decide: each 
+        course in free has an allowed assignment, one of assigned, and no other
+        candidate presolve leaves open"""
+        for k in free:
+            idx = self.cands.candidatesOfCourse(k)
+            if assigned[k] < 0 or (self.model_lb[idx] < self.model_ub[idx]).any():
+                return False
+        return True
+
+    def reoptimize(self, seeds, score_weights, pref_weight, e_cap_weight, congestion_weight, 
+                   dept_fairness, b2b_weight, stability_weight=0, time_limit=None, kinds=None):
+        """Large neighborhood search around seeds, the indices of changed courses.
+        Every course keeps its current assignment except those in the neighborhood
+        (see neighborhood()) of the seeds, which is re-solved for each of kinds in turn
+        (default config LNS_NEIGHBORHOODS).  A solution is only kept if it improves
+        the schedule, so ties and solves stopped within REL_GAP move nothing.
+        Courses that moved seed the next round, until none move or time_limit secs 
+        (default config LNS_SECONDS) pass.  A solve running at the time limit is 
+        stopped as by requestStop().
+        Courses without an allowed assignment are always free, so seed as well.
+        Neighborhoods with nothing to decide are not solved.
+        Returns the number of neighborhoods solved, 0 if the schedule is kept as is"""
+        weights = (score_weights, pref_weight, e_cap_weight, 
+                   congestion_weight, dept_fairness, b2b_weight, stability_weight)
+        if time_limit is None:
+            time_limit = self.config.LNS_SECONDS
+        kinds = [kind.strip().upper() for kind in (kinds or self.config.LNS_NEIGHBORHOODS)]
+
+        current = self._assignedCandidates()
+        frontier = sorted(set(seeds) | set(np.nonzero(current < 0)[0].tolist()))
+        best = None
+        if (current >= 0).all():
+            best = self.scheduleObjective([(c.assignedRoom, c.assignedTime) 
+                                            for c in self.course_list], *weights)
+        visited, solves, stale = set(), 0, False
+
+        timed_out = threading.Event()
+        def stopAtLimit():
+            timed_out.set()
+            self.requestStop()
+        timer = threading.Timer(time_limit, stopAtLimit)
+        timer.daemon = True
+        timer.start()
+        try:
+            while not self.stopRequested():
+                moved, last_free = set(), None
+                for kind in kinds:
+                    free = self.neighborhood(frontier, kind)
+                    if free == last_free or self._pinned(free, current):
+                        continue
+                    self.fixOutside(free)
+                    try:
+                        self.updateObjFcnAndSolve(*weights)
+                    except ses.SESError:
+                        #stopped before this neighborhood found a solution
+                        if timed_out.is_set() and best is not None:
+                            stale = True
+                            break
+                        raise
+                    solves, last_free = solves + 1, free
+                    obj = self.objectiveValue(*weights)
+                    stale = best is not None and obj <= best + 1e-6 * max(abs(best), 1.)
+                    if not stale:
+                        best = obj
+                        self.retrieveAssignment()
+                        assigned = self._assignedCandidates()
+                        moved.update(np.nonzero(assigned != current)[0].tolist())
+                        current = assigned
+                    if self.stopRequested():
+                        break
+
+                visited.update(frontier)
+                frontier = sorted(moved - visited)
+                if not frontier:
+                    break
+
+            #the solver holds a rejected solution, so solve for the kept schedule
+            timer.cancel()
+            if stale:
+                if timed_out.is_set():
+                    self.resetStop()
+                self.fixOutside([])
+                self.updateObjFcnAndSolve(*weights)
+        finally:
+            timer.cancel()
+            self.fixOutside(None)
+            if timed_out.is_set():
+                self.resetStop()
+        return solves
+
+    def getMaxCong(self):
+        return self._solutionValues()[self.maxCongVar]
+
+    def objectiveValue(self, score_weights, pref_weight, e_cap_weight,
+                       congestion_weight, dept_fairness, b2b_weight, stability_weight=0):
+        """Objective value of the last solution under the given weights"""
+        score_weights = self._normalizeScoreWeights(score_weights)
+        return np.dot(self._objCoefs(score_weights, pref_weight, e_cap_weight, 
+                                     congestion_weight, dept_fairness, b2b_weight, 
+                                     stability_weight), 
+                      self._solutionValues())
+
+    def scheduleObjective(self, assignments, score_weights, pref_weight, e_cap_weight,
+                          congestion_weight, dept_fairness, b2b_weight, stability_weight=0):
+        """Objective value of assignments, the (room, TimeSlot) of each course, 
+        e.g. a schedule found by another model.  
+        Raises SESError if some assignment is not a candidate of this model"""
+        x = np.zeros(self.numCols())
+        for k, (room, ts) in enumerate(assignments):
+            indx = self.cands.candidateOf(k, room, ts)
+            if indx is None:
+                raise ses.SESError("%s %s is not allowed for course %s" % 
+                                    (room, ts, self.course_list[k]))
+            x[indx] = 1.
+
+        #the other columns take their best values given the candidates
+        for b2b_indx, (indx1, c2_indices) in zip(self.b2b_vars, self.b2b_links):
+            x[b2b_indx] = min(x[indx1], x[c2_indices].sum())
+        x[self.maxCongVar] = max([x[self.cands.atInstant(its)].sum() 
+                                    for its in self.allTimeSlots] + [0.])
+        score_weights = self._normalizeScoreWeights(score_weights)
+        rows, cols, coefs = self._fairnessRows(score_weights)
+        x[self.minDept] = np.bincount(rows, coefs * x[cols], 
+                                      minlength=len(self.dept_size)).min()
+
+        return np.dot(self._objCoefs(score_weights, pref_weight, e_cap_weight, 
+                                     congestion_weight, dept_fairness, b2b_weight, 
+                                     stability_weight), x)
+
+    def _chosen(self):
+        """Indices of the candidates of the last solution"""
+        values = self._solutionValues()[:len(self.cands)]
+        return np.nonzero(values > 1 - 1e-3)[0]
+
+    def chosenTimes(self):
+        """TimeSlot of each course in the last solution"""
+        times = [None] * len(self.course_list)
+        chosen = self._chosen()
+        for k, t in zip(self.cands.course_ix[chosen].tolist(), self.cands.ts_ix[chosen].tolist()):
+            times[k] = self.cands.timeslots[t]
+        return times
+
+    def chosenRooms(self):
+        """Index into cands.rooms of the room, or room class, of each course in the 
+        last solution"""
+        room_ix = [None] * len(self.course_list)
+        chosen = self._chosen()
+        for k, r in zip(self.cands.course_ix[chosen].tolist(), 
+                        self.cands.room_ix[chosen].tolist()):
+            room_ix[k] = r
+        return room_ix
+
+    def retrieveAssignment(self):
+        """Return a course list with the correct assignments.
+        The capacity of a room class holds at each time instant, which does not 
+        ensure its courses can be matched to its rooms across the days of their times.
+        If they cannot, the last solve is repeated over every room, see _solveFullRooms"""
+        chosen = self._chosen()
+        try:
+            return self.assignCandidates(chosen)
+        except helpers.MatchError:
+            return self._solveFullRooms()
+
+    def _solveFullRooms(self):
+        """Solve the last weights with a model over every inventory room, and 
+        assign its schedule.  Returns the course list"""
+        if self.weights is None:
+            raise ses.SESError("Optimizer has not been solved yet.")
+        config_details = copy.copy(self.config)
+        config_details.AGGREGATE_ROOMS = False
+        full = self.__class__(self.course_list, self.roomInventory, config_details, 
+                              self.noConflictGroups, self.enforceFreeTime, self.quiet, 
+                              self.b2b_pairs)
+        if self.fixed_times is not None:
+            full.fixTimes(self.fixed_times)
+        if self.reference is not None:
+            full.setReference(self.reference)
+        full._stop, full.progressCallback = self._stop, self.progressCallback
+        full.roomWarnings = False
+        full.build()
+        full.updateObjFcnAndSolve(*self.weights)
+        return full.retrieveAssignment()
+
+    def assignCandidates(self, chosen):
+        """Assign every course its candidate in chosen, e.g. from a heuristic.
+        Returns the course list"""
+        chosen = np.asarray(chosen)
+        for v, room in zip(chosen.tolist(), self._matchRooms(chosen)):
+            c, r, t = self.cands.candidate(v)
+            c.addAssignment(room, t, testViable=False)
+
+        return self.course_list
+
+    def _matchRooms(self, chosen):
+        """Concrete room of each of the chosen candidates.
+        Courses in an aggregated room class are matched to its rooms, see helpers.matchRooms"""
+        cands = self.cands
+        rooms = [cands.rooms[r] for r in cands.room_ix[chosen].tolist()]
+        if (cands.room_size[cands.room_ix[chosen]] == 1).all():
+            return rooms
+
+        #back2back partners share a room when possible
+        partners = {}
+        for c1_tuple, c2_tuple in self.b2b_pairs:
+            for k1 in cands.coursesMatching(*c1_tuple):
+                for k2 in cands.coursesMatching(*c2_tuple):
+                    partners.setdefault(k1, []).append(k2)
+                    partners.setdefault(k2, []).append(k1)
+
+        for r, group in groupBy(cands.room_ix[chosen], np.arange(len(chosen))):
+            members = cands.roomMembers(r)
+            if len(members) == 1:
+                continue
+            group = group.tolist()
+            courses = cands.course_ix[chosen[group]].tolist()
+            pos = dict(zip(courses, range(len(group))))
+            group_partners = dict((pos[k], [pos[k2] for k2 in partners[k] if k2 in pos]) 
+                                    for k in courses if k in partners)
+            times = [cands.timeslots[t] for t in cands.ts_ix[chosen[group]].tolist()]
+            for i, room_ix in zip(group, helpers.matchRooms(times, len(members), 
+                                                            group_partners)):
+                rooms[i] = members[room_ix]
+        return rooms
+
+    #these allow handles on internal data
+    def getCourses(self):
+        return self.course_list
+
+    #these allow handles on internal data
+    def getRoomInventory(self):
+        return self.roomInventory
+
+    def getDepts(self):
+        """Return a list of all the departments
+        ordered alphabetically"""
+        all_depts = [c.dept for c in self.course_list]
+        all_depts = list(set(all_depts))
+        return sorted(all_depts)
@@ -0,0 +1,131 @@
+""" Builds and Solves the SES Optimization Model
+    This uses the open-source CBC solver via PuLP (1.6 or later, which runs on
+    python 2 and ships a CBC binary)
+
+    PuLP writes the whole model for CBC on every solve, so bounds and fairness
+    rows are simply changed on the PuLP model, and the values of the last solve
+    survive changes of the bounds.
+
+    PuLP cannot pass a starting solution to CBC on every version, so warm starts
+    are computed and kept in mip_start but not used.
+    Nor can CBC be interrupted, so requestStop() only takes effect before CBC starts,
+    and the time limit of reoptimize() is only checked between neighborhoods.
+    PuLP returns neither the bound nor the node count, so progress only records the
+    final solution, with the incumbent as bound: CBC stops within REL_GAP of it."""
+
+import numpy as np
+import pulp
+
+import sesClasses as ses
+from optimizer_base import OptimizerBase
+
+#pulp senses of 'L', 'G', 'E'
+_SENSES = {"L":pulp.LpConstraintLE, "G":pulp.LpConstraintGE, "E":pulp.LpConstraintEQ}
+
+class Optimizer(OptimizerBase):
+    """Builds and solves scheduling optimization.
+
+    Attributes, beyond those of OptimizerBase:
+        m - pulp LpProblem
+        vars - list of pulp LpVariables.  vars[i] is column i, named x<i>
+        fairness_names - names of the dept fairness rows in m, in getDepts() order
+        mip_start - the (cols, values) warm start of the last solve, or None.  Unused
+    """
+
+    def __init__(self, course_list, roomInventory, configDetails,
+                 noConflictGroups=None, enforceFreeTime=True, quiet=False,
+                 b2b_pairs = []):
+        """NoConflictGroups is a dict {cnst_name: list[ (number, section, classtype)]"""
+        OptimizerBase.__init__(self, course_list, roomInventory, configDetails,
+                               noConflictGroups, enforceFreeTime, quiet, b2b_pairs)
+        self.m = pulp.LpProblem("SesModel", pulp.LpMaximize)
+        self.vars, self.fairness_names = [], []
+        self.mip_start = None
+
+    def _loadModel(self):
+        """Columns and rows are named by index, since pulp mangles and must not
+        collide names.  col_names, row_names hold the readable names"""
+        self.vars = [pulp.LpVariable("x%d" % i,
+                                     cat=pulp.LpInteger if binary else pulp.LpContinuous)
+                     for i, binary in enumerate(self.col_binary.tolist())]
+        for r, (cols, coefs) in enumerate(self.rowSlices()):
+            self._addRow(cols, coefs, self.row_sense[r], self.row_rhs[r], "r%d" % r)
+
+    def _addRow(self, cols, coefs, sense, rhs, name):
+        """Add, or replace, the row sum(coefs * vars[cols]) (sense) rhs"""
+        expr = pulp.LpAffineExpression(zip([self.vars[i] for i in cols.tolist()],
+                                           coefs.tolist()))
+        constr = pulp.LpConstraint(expr, _SENSES[sense], name, float(rhs))
+        if name in self.m.constraints:
+            self.m.constraints[name] = constr
+        else:
+            self.m.addConstraint(constr)
+
+    def _setBounds(self):
+        """pulp reads the bounds off the vars when it writes the model"""
+        for var, lb, ub in zip(self.vars, self.col_lb.tolist(), self.col_ub.tolist()):
+            var.lowBound = None if np.isinf(lb) else lb
+            var.upBound = None if np.isinf(ub) else ub
+
+    def writeLP(self, file_name):
+        """Writes underlying LP to a file.  Column i is x<i>, row r is r<r>"""
+        if not file_name.endswith(".lp"):
+            file_name += ".lp"
+        self._setBounds()
+        self.m.writeLP(file_name)
+
+    def _isSolved(self):
+        return self.m.status == pulp.LpStatusOptimal
+
+    def _solutionValues(self):
+        if not self._isSolved():
+            raise ses.SESError("Optimizer has not been solved yet. Status: %s" %
+                               pulp.LpStatus[self.m.status])
+        return np.array([var.varValue for var in self.vars], dtype=float)
+
+    def addDeptFairnessConstraints(self, choice_weights):
+        """maximize the avg_score of the minimal dept
+        Each row is replaced by one built from its own (cols, coefs)"""
+        slices = self._fairnessSlices(choice_weights)
+        self.fairness_names = ["DeptFairness_%d" % r for r in range(len(slices))]
+        for name, (cols, coefs) in zip(self.fairness_names, slices):
+            self._addRow(cols, coefs, "G", 0., name)
+
+    def updateObjFcnAndSolve(self, score_weights, pref_weight, e_cap_weight,
+            congestion_weight, dept_fairness, b2b_weight, stability_weight=0):
+        """choiceweights should be in order [1st choice, 2nd choice, etc]"""
+        self.weights = (score_weights, pref_weight, e_cap_weight,
+                        congestion_weight, dept_fairness, b2b_weight, stability_weight)
+        score_weights = self._normalizeScoreWeights(score_weights)
+
+        #fairness rows are replaced
+        self.addDeptFairnessConstraints(score_weights)
+        obj_coefs = self._objCoefs(score_weights, pref_weight, e_cap_weight,
+                                   congestion_weight, dept_fairness, b2b_weight,
+                                   stability_weight)
+        #every column, zero or not, so each is written for CBC, even those in no row
+        self.m.setObjective(pulp.LpAffineExpression(zip(self.vars, obj_coefs.tolist())))
+        self._setBounds()
+
+        if self.stopRequested():
+            raise ses.SESError("Optimization cancelled before a solution was found.")
+
+        #pulp may have no way to take the warm start
+        self.mip_start = self.mipStart()
+
+        self._startProgress()
+        solver = pulp.PULP_CBC_CMD(msg=not self.quiet,
+                                   options=["ratio %g" % self.config.REL_GAP])
+        try:
+            self.m.solve(solver)
+        except pulp.PulpSolverError as e:
+            raise ses.SESError("Optimizer did not solve. %s" % e)
+
+        if self.m.status == pulp.LpStatusInfeasible:
+            raise ses.SESError("Optimization Infeasible.")
+        elif not self._isSolved():
+            raise ses.SESError("Optimizer did not solve. Status: %s" %
+                               pulp.LpStatus[self.m.status])
+
+        incumbent = pulp.value(self.m.objective)
+        self._recordProgress(incumbent, incumbent, None, force=True)
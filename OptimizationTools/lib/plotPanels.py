@@ -431,6 +431,49 @@ class HeatMapPanel(MyPanel):
         return cax
 
 
+class ProgressPanel(MyPanel):
+    def __init__(self, *args, **kwargs):
+        MyPanel.__init__(self, *args, **kwargs)        
+        self.vbox = wx.BoxSizer(wx.VERTICAL)
+        self.fig = Figure(facecolor=self.face_col)
+        
+        self.ax = self.fig.add_subplot(111)
+        self.records = []
+
+        self.canvas = FigureCanvas(self, -1, self.fig)
+        self.vbox.Add(self.canvas, flag = wx.EXPAND | wx.ALL)
+        self.SetSizerAndFit(self.vbox)
+
+        pub.subscribe(self.reset, "optimization_started")
+        pub.subscribe(self.update, "solver_progress")
+
+    def reset(self, message):
+        """Listener for the optimization_started event"""
+        self.records = []
+        self.ax.clear()
+        self.canvas.draw()
+
+    def update(self, message):
+        """Plot incumbent and bound over time.  Listener for the solver_progress event"""
+        self.records.append(message.data)
+        times = [r[0] for r in self.records]
+        bounds = [r[2] for r in self.records]
+        found = [r for r in self.records if r[1] is not None]
+
+        self.ax.clear()
+        self.ax.step(times, bounds, where="post", color="orange", label="Bound")
+        if found:
+            self.ax.step([r[0] for r in found], [r[1] for r in found], where="post", 
+                    color="cornflowerblue", label="Incumbent")
+            self.ax.set_title("Solver Progress (Gap %.2f%%)" % (100 * found[-1][3]))
+        else:
+            self.ax.set_title("Solver Progress")
+        self.ax.set_xlabel("Time (secs)")
+        self.ax.set_ylabel("Objective")
+        self.ax.legend(loc="lower right")
+        self.canvas.draw()
+
+
 class LogPanel(MyPanel):
     def __init__(self, *args, **kwargs):
         MyPanel.__init__(self, *args, **kwargs)        
@@ -0,0 +1,66 @@
+""" Presolve of the SES Optimization Model
+
+A course with a single candidate (respectRoom and respectTime, say) is a constant,
+yet still appears in every row of the time instants it occupies.  presolve()
+fixes it, subtracts its occupancy from the room, instructor and no conflict rows,
+drops the rows left trivially satisfied, and fixes to 0 the candidates that now
+clash with it.  The reduced rows are handed to the solver.
+
+Every column is kept, fixed ones with lb == ub, so candidate i is still column i.
+The reductions are repeated until none applies:
+    redundant rows - satisfied whatever the values of their columns, dropped
+    forcing rows - satisfied only with every column at the bound of least
+        (or greatest) activity, which fixes the columns.  A course with one
+        candidate has the forcing row sum x = 1, and a room or instructor row
+        already full at an instant forces the other candidates there to 0
+"""
+import numpy as np
+import sesClasses as ses
+
+#slack in comparing row activities to the rhs
+TOL = 1e-9
+
+def presolve(indptr, indices, data, sense, rhs, lb, ub, row_names):
+    """Reduce the rows (CSR indptr, indices, data, sense, rhs) given the column
+    bounds lb, ub, which are tightened in place.
+    Returns (indptr, indices, data, sense, rhs, kept) of the reduced rows,
+    where kept are the indices of the rows kept.
+    Raises SESError naming a row that cannot be satisfied"""
+    num_rows = len(indptr) - 1
+    row_of = np.repeat(np.arange(num_rows), np.diff(indptr))
+    sense = np.asarray(sense)
+    upper, lower = sense <> "G", sense <> "L"
+    active = np.ones(num_rows, dtype=bool)
+    pos = data > 0
+    while True:
+        #least and greatest activity of each row
+        low = np.bincount(row_of, np.where(pos, data * lb[indices], data * ub[indices]),
+                          minlength=num_rows)
+        high = np.bincount(row_of, np.where(pos, data * ub[indices], data * lb[indices]),
+                           minlength=num_rows)
+        bad = active & ((upper & (low > rhs + TOL)) | (lower & (high < rhs - TOL)))
+        if bad.any():
+            raise ses.SESError("Infeasible. Constraint %s cannot be satisfied" %
+                               row_names[np.nonzero(bad)[0][0]])
+        active &= ~((~upper | (high <= rhs + TOL)) & (~lower | (low >= rhs - TOL)))
+
+        to_low = (active & upper & (low >= rhs - TOL))[row_of]
+        to_high = (active & lower & (high <= rhs + TOL))[row_of]
+        if not (to_low.any() or to_high.any()):
+            break
+        #coefs > 0 take their lb at the least activity
+        for mask, at_lb in ((to_low, pos), (to_high, ~pos)):
+            cols = indices[mask & at_lb]
+            ub[cols] = lb[cols]
+            cols = indices[mask & ~at_lb]
+            lb[cols] = ub[cols]
+
+    #fixed columns move to the rhs
+    fixed = (lb == ub)[indices]
+    rhs = rhs - np.bincount(row_of[fixed], data[fixed] * lb[indices[fixed]],
+                            minlength=num_rows)
+    keep = active[row_of] & ~fixed
+    kept = np.nonzero(active)[0]
+    lengths = np.bincount(row_of[keep], minlength=num_rows)[kept]
+    return (np.concatenate(([0], np.cumsum(lengths))), indices[keep], data[keep],
+            sense[kept].tolist(), rhs[kept], kept)
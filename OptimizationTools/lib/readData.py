@@ -1,11 +1,56 @@
 """ Create a list of courses from .csv files
     Structure of files is assumed from excel prototype"""
 
-import csv
+import csv, os, hashlib, tempfile
+import cPickle as pickle
 import sesClasses as ses
 from sys import __stdout__ #default logging location  
 from wx.lib.pubsub import Publisher as pub
 
+#Bump whenever the importers or the pickled classes change
+SNAPSHOT_VERSION = 1
+
+class CourseIndex:
+    """Lookup of courses by (number, section, classtype).  
+    Keys are normalized as in Course.isSame, so a blank classtype means LEC."""
+    def __init__(self, courses=()):
+        self.courses = {}
+        for c in courses:
+            self.add(c)
+
+    @staticmethod
+    def key(num, sec, classtype):
+        if not classtype.strip():
+            classtype = "LEC"
+        return (num.strip().upper(), sec.strip().upper(), classtype.strip().upper())
+
+    def add(self, course):
+        self.courses[course.key] = course
+
+    def get(self, num, sec, classtype):
+        """Return the matching course or None"""
+        return self.courses.get(self.key(num, sec, classtype))
+
+    def __contains__(self, course):
+        return course.key in self.courses
+
+class RoomIndex:
+    """Lookup of rooms by name, e.g. 'E51-145'"""
+    def __init__(self, rooms=()):
+        self.rooms = {}
+        for r in rooms:
+            self.add(r)
+
+    def add(self, room):
+        self.rooms[str(room)] = room
+
+    def get(self, roomName):
+        """Return the matching room or None"""
+        return self.rooms.get(roomName.strip().upper())
+
+    def __contains__(self, room):
+        return str(room) in self.rooms
+
 
 def importNoConflictGroups(csv_filename):
     """Import the list of groups which cannot conflict."""
@@ -32,7 +77,7 @@ def importRoomInventory(csv_filename):
     f = csv.reader(open(csv_filename, 'rU'))
     headers = f.next()
 
-    rooms = []
+    rooms, index = [], RoomIndex()
     for roomInfo in f:
         #Treat the seating style separately
         assert(headers[2] == "Seating Style")
@@ -46,11 +91,11 @@ def importRoomInventory(csv_filename):
         av_equip += [h for h,r in paired_info if r ] 
      
         sName = roomInfo[0]
-        if sName in rooms:
+        r = ses.Room(sName, roomInfo[1], av_equip)
+        if r in index:
             raise ses.SESError("Room %s appears twice in inventory." % sName)
-        else:
-            r = ses.Room(sName, roomInfo[1], av_equip)
-            rooms.append(r)     
+        index.add(r)
+        rooms.append(r)     
     
     return rooms
 
@@ -74,7 +119,7 @@ def importCourses(csv_filename, roomInventory):
         if h in old_names:
             headers[indx] = headers_dict[h]
 
-    courses = []
+    courses, index, room_index = [], CourseIndex(), RoomIndex(roomInventory)
     for vals in f:
         d = dict(zip(headers, vals))
 
@@ -108,38 +153,32 @@ def importCourses(csv_filename, roomInventory):
         d["firstTimePref"] = timePrefs[0]
         del d["half"]
 
-        roomPrefs, in_inv = _createRooms(d, roomInventory, respectRoom)
+        roomPrefs, in_inv = _createRooms(d, room_index, respectRoom)
         
         c = ses.Course(**d)
         c.addExtraInstructors(instructors[1:])
         c.addTimePrefs(timePrefs[1:])
         c.addRoomPrefs(roomPrefs, respectRoom)
 
-        if c in courses:
+        if c in index:
             raise ses.SESError("Attempted to add Course %s twice" % c)
 
+        index.add(c)
         courses.append(c)
 
     #Every recitation/breakout has a partner lecture
     for c in courses:
         if c.isRec() or c.isBreakout():
-            partner_courses = filter(lambda x: x.isSame(c.number, c.section, "LEC"), 
-                                     courses)
-            #exit early for efficiency
-            if len(partner_courses) == 1:
-                continue
-            elif not partner_courses:
+            if index.get(c.number, c.section, "LEC") is None:
                 raise ses.SESError("Course %s has no partner lecture" % c)
-            else:
-                raise ses.SESError("Course %s has %d possible partner lectures" % 
-                            (c, len(partner_courses)))
 
         
     return courses
 
-def _createRooms(d, roomInventory, respectRoom, num_prefs = 3):
+def _createRooms(d, roomIndex, respectRoom, num_prefs = 3):
     """return a prefernece ordered, list of rooms.  
     d is a dictionary of room_prefs {"Room 1":"E51-135", "Room 2":"E62-133"}
+    roomIndex is a RoomIndex of the inventory
     blank requests are ignored.
     Rooms not in inventory will be created if respectRoom = True.
     If room not inventory, and not "respect", will log error."""
@@ -151,12 +190,11 @@ def _createRooms(d, roomInventory, respectRoom, num_prefs = 3):
         if not roomName:
             continue
         
-        #search for it in the list.  
-        room_list = filter(lambda x: str(x) == roomName, roomInventory)
+        #search for it in the inventory
+        room = roomIndex.get(roomName)
         
-        if room_list:
-            assert len(room_list) == 1
-            out.append(room_list[0])
+        if room is not None:
+            out.append(room)
 #         elif respectRoom:
 #             out.append(ses.Room(roomName, ses.Room.MAX_SIZE))
         else:
@@ -187,8 +225,8 @@ def _createTimeSlot(d, ix):
     if d["Days " + str(ix)]:
         days = d["Days " + str(ix)].split(", ")
         days = " ".join(days)
-        ts = ses.TimeSlot(d["half"], days, d["Start Time " + str(ix)], 
-                            d["End Time " + str(ix)])
+        ts = ses.TimeSlot.interned(d["half"], days, d["Start Time " + str(ix)], 
+                                   d["End Time " + str(ix)])
     else:
         ts = None
 
@@ -202,19 +240,15 @@ def addAssignments(courses, roomInventory, csv_filename):
     """
     f = csv.reader(open(csv_filename, 'rU'))
     headers = f.next()
-    all_viable = []
+    course_index, room_index = CourseIndex(courses), RoomIndex(roomInventory)
 
     for courseInfo in f:
         d = dict(zip(headers, courseInfo))
         #make sure course exists        
-        find_course = lambda c : c.isSame(d["Course"], d["Section"], d["classtype"])
-        course = filter(find_course, courses) 
-        if not course:
+        course = course_index.get(d["Course"], d["Section"], d["classtype"])
+        if course is None:
             raise ses.SESError("Course %s-%s-%s not in list" % 
                     (d["Course"], d["Section"], d["classtype"]))
-        else:
-            assert(len(course) == 1)
-            course = course[0]
 
         #we only add details for courses that are properly assigned
         if not (d["Room"] and d["StartTime"] and d["EndTime"] and d["Days"]):
@@ -223,13 +257,8 @@ def addAssignments(courses, roomInventory, csv_filename):
             continue
             
         #create the room
-        #this is an annoyance because of roomnames
-        find_room = lambda r: str(r) == d["Room"].strip().upper()
-        room = filter(find_room, roomInventory)
-        if room:
-            assert len(room == 0)
-            room = room[0]
-        else:
+        room = room_index.get(d["Room"])
+        if room is None:
             #fail silently
             pub.sendMessage("warning", "Room %s not in inventory\n" % d["Room"])
             room = ses.Room(d["Room"], ses.Room.MAX_SIZE)
@@ -237,7 +266,7 @@ def addAssignments(courses, roomInventory, csv_filename):
         #create the timeslot
         sdays = d["Days"].split(", ")
         sdays = " ".join(sdays)
-        ts = ses.TimeSlot(d["Half"], sdays, d["StartTime"], d["EndTime"])
+        ts = ses.TimeSlot.interned(d["Half"], sdays, d["StartTime"], d["EndTime"])
 
         course.addAssignment(room, ts, False)
 
@@ -257,30 +286,142 @@ def importB2BPairs(b2b_path, courses):
 
     #drop the headers
     f.next()    
-    out = []
+    out, index = [], CourseIndex(courses)
     for line in f:
         c1 = tuple(line[:3])
         c2 = tuple(line[3:])
         
-        courses_1 = filter(lambda c: c.isSame(*c1), courses)
-        if not courses_1:
+        if index.get(*c1) is None:
             pub.sendMessage("warning", 
                     "Course %s %s %s from B2B file not found.  Constraint Skipped." % c1)
             continue
-        elif len(courses_1) > 1:
-            raise ses.SESError("Multiple courses match B2B listing %s %s %s" % c1)
 
-        courses_2 = filter(lambda c: c.isSame(*c2), courses)
-        if not courses_2:
+        if index.get(*c2) is None:
             pub.sendMessage("warning", 
                     "Course %s %s %s from B2B file not found.  Constraint Skipped." % c2)
             continue
-        elif len(courses_2) > 1:
-            raise ses.SESError("Multiple courses match B2B listing %s %s %s" % c2)
 
         out.append((c1, c2))
     return out
 
+def _fileDigest(path):
+    """sha1 of the file contents, or a marker if it cannot be read"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except IOError:
+        return "missing"
+
+def _sourceDigest():
+    """sha1 of the source of the importers and the pickled classes, 
+    so snapshots of older code are never loaded"""
+    key = hashlib.sha1(str(SNAPSHOT_VERSION))
+    for module_path in (__file__, ses.__file__):
+        key.update(_fileDigest(os.path.splitext(module_path)[0] + ".py"))
+    return key.hexdigest()
+
+def _isPrivate(st, is_dir=False):
+    """True if the stat st is owned by the current user, and a directory 
+    is writable by no one else.  Always True where there are no uids, i.e. windows"""
+    if not hasattr(os, "getuid"):
+        return True
+    return st.st_uid == os.getuid() and not (is_dir and st.st_mode & 0o022)
+
+def _privateCacheDir(cache_dir):
+    """Create cache_dir readable by the current user only, if needed.  
+    Returns False if it exists but is not private to the current user"""
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir, 0o700)
+        except OSError:
+            pass #created meanwhile, or cannot be.  Checked below
+    try:
+        return _isPrivate(os.stat(cache_dir), is_dir=True)
+    except OSError:
+        return False
+
+def _loadSnapshot(snapshot_path):
+    """The pickled tuple at snapshot_path, or None if it is missing
+    or not owned by the current user"""
+    try:
+        f = open(snapshot_path, 'rb')
+    except IOError:
+        return None
+    with f:
+        if not _isPrivate(os.fstat(f.fileno())):
+            pub.sendMessage("warning", "Data snapshot %s ignored.  It is not owned by "
+                            "the current user." % snapshot_path)
+            return None
+        return pickle.load(f)
+
+def _saveSnapshot(snapshot_path, data):
+    """Pickle data to snapshot_path through a private temporary file, so readers 
+    never see a partial snapshot.  A failed write only costs the speed up next time"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(snapshot_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+        try:
+            os.rename(tmp_path, snapshot_path)
+        except OSError:
+            #windows cannot rename over an existing file
+            os.remove(snapshot_path)
+            os.rename(tmp_path, snapshot_path)
+    except (IOError, OSError, pickle.PicklingError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+class _WarningLog:
+    """Records the warnings published while active"""
+    def __init__(self):
+        self.msgs = []
+
+    def record(self, message):
+        self.msgs.append(message.data)
+
+def importDataset(courses_path, rooms_path, no_conflicts_path, b2b_path, 
+                    cache_dir=None):
+    """Import everything needed for a model.  
+    Returns (rooms, courses, no_conflicts, b2b_pairs)
+
+    If cache_dir is given, the parsed data is snapshotted there keyed by the 
+    contents of the input files and the source of this module and sesClasses.  
+    Reloading unchanged files reads the snapshot and republishes the warnings 
+    issued when it was created.  Snapshots are unpickled, so cache_dir and its
+    snapshots are only used if private to the current user.
+    """
+    snapshot_path = None
+    if cache_dir is not None and not _privateCacheDir(cache_dir):
+        pub.sendMessage("warning", "Data cache %s ignored.  It must be owned, and only "
+                        "writable, by the current user." % cache_dir)
+    elif cache_dir is not None:
+        key = hashlib.sha1(_sourceDigest())
+        for path in (courses_path, rooms_path, no_conflicts_path, b2b_path):
+            key.update(_fileDigest(path))
+        snapshot_path = os.path.join(cache_dir, key.hexdigest() + ".pkl")
+
+        snapshot = _loadSnapshot(snapshot_path)
+        if snapshot is not None:
+            rooms, courses, no_conflicts, b2b_pairs, warnings = snapshot
+            for msg in warnings:
+                pub.sendMessage("warning", msg)
+            return rooms, courses, no_conflicts, b2b_pairs
+
+    log = _WarningLog()
+    pub.subscribe(log.record, "warning")
+    try:
+        rooms = importRoomInventory(rooms_path)
+        no_conflicts = importNoConflictGroups(no_conflicts_path)
+        courses = importCourses(courses_path, rooms)
+        b2b_pairs = importB2BPairs(b2b_path, courses)
+    finally:
+        pub.unsubscribe(log.record)
+
+    if snapshot_path is not None:
+        _saveSnapshot(snapshot_path, (rooms, courses, no_conflicts, b2b_pairs, log.msgs))
+
+    return rooms, courses, no_conflicts, b2b_pairs
+
 def convertYesNoToBool(yes_no, default_blank):
     "Convert 'Y'/'N'/'' to true/false/default_blank resp"
     if yes_no.strip().upper() == "Y":
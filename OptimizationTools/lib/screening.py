@@ -0,0 +1,156 @@
+""" Screens the SES Optimization Model for infeasibility before it is built
+
+When the model is infeasible, the solvers explain it by refining a conflict (cplex)
+or computing an IIS (gurobi), which can take longer than the solve itself.
+The checks here only look at the candidates, so take milliseconds.  Each is a
+necessary condition of the model, so every finding proves the model infeasible
+and names the courses at fault.  Passing them does not prove the model feasible.
+
+A course with a single candidate time is fixed in time, so certainly occupies
+every time instant overlapping that time.
+"""
+import numpy as np
+import helpers
+
+def screen(optimizer):
+    """Check the model of optimizer, an OptimizerBase, before build().
+    Returns a list of (message, list of Courses), one per problem found.
+    Courses without a viable room are reported alone, since the candidates
+    cannot be generated"""
+    findings = _noRooms(optimizer.course_list, optimizer.cands.roomInventory)
+    if findings:
+        return findings
+    optimizer.prepareCandidates()
+    cands = optimizer.cands
+    findings = _breakouts(cands)
+
+    #the same problem shows up at every instant of the times involved
+    groups = _conflictGroups(cands, optimizer.noConflictGroups)
+    room_masks = {}
+    seen = set()
+    for its, courses in _occupancy(cands, optimizer.allTimeSlots):
+        for check, ks, message in (_instructors(cands, its, courses) +
+                                   _conflicts(cands, its, courses, groups) +
+                                   _roomCapacity(cands, its, courses, room_masks)):
+            key = (check, tuple(sorted(ks)))
+            if key not in seen:
+                seen.add(key)
+                findings.append((message, [cands.courses[k] for k in key[1]]))
+    return findings
+
+def _names(cands, ks):
+    return ", ".join(str(cands.courses[k]) for k in ks)
+
+def _noRooms(courses, roomInventory):
+    """Courses without a viable room, see helpers.allowedRooms.  
+    Every course has some allowed time"""
+    viable = helpers.roomViability(courses, roomInventory)
+    return [("Course %s has no viable room for %d students%s" % (c, c.enrollment, 
+                " with " + ", ".join(c.av_requirements) if c.av_requirements else ""), [c])
+            for k, c in enumerate(courses) if not c.respectRoom and not viable[k].any()]
+
+def _breakouts(cands):
+    """Breakouts none of whose candidates has a lecture candidate at the same time
+    on the same floor"""
+    breakouts = np.nonzero(cands.is_breakout)[0]
+    if not len(breakouts):
+        return []
+    course_ix = cands.course_ix
+    has_breakout = np.zeros(cands.lecrec_ix.max() + 1, dtype=bool)
+    has_breakout[cands.lecrec_ix[breakouts]] = True
+
+    #(number + section, time, floor) of the lecture candidates
+    is_lec = ~cands.is_rec[course_ix] & ~cands.is_breakout[course_ix]
+    lecs = np.nonzero(is_lec & has_breakout[cands.lecrec_ix[course_ix]])[0]
+    keys = lambda idx: zip(cands.lecrec_ix[course_ix[idx]].tolist(), cands.ts_ix[idx].tolist(),
+                           cands.room_floor[cands.room_ix[idx]].tolist())
+    lec_keys = set(keys(lecs))
+
+    findings = []
+    for k in breakouts.tolist():
+        idx = cands.candidatesOfCourse(k)
+        if len(idx) and not lec_keys.intersection(keys(idx)):
+            findings.append(("Breakout %s has no room on the floor of its lecture at the same time" %
+                             cands.courses[k], [cands.courses[k]]))
+    return findings
+
+def _occupancy(cands, instants):
+    """(instant, array of the courses fixed in time at it) for every occupied instant"""
+    by_time = {}
+    for k in xrange(len(cands.courses)):
+        ts = np.unique(cands.ts_ix[cands.candidatesOfCourse(k)])
+        if len(ts) == 1:
+            by_time.setdefault(ts[0], []).append(k)
+
+    occupancy = []
+    for its in instants:
+        courses = [k for t, ks in by_time.items() if cands.timeslots[t].overlap(its) 
+                        for k in ks]
+        if courses:
+            occupancy.append((its, np.array(sorted(courses), dtype=int)))
+    return occupancy
+
+def _instructors(cands, its, courses):
+    """Instructors teaching several courses at once, as instructorConstraints"""
+    courses_of = {}
+    for k in courses.tolist():
+        for prof in cands.prof_ix[cands.prof_ptr[k]:cands.prof_ptr[k + 1]].tolist():
+            courses_of.setdefault(prof, []).append(k)
+
+    findings = []
+    for prof, prof_courses in sorted(courses_of.items()):
+        if len(prof_courses) > 1:
+            findings.append(("instructor", prof_courses, 
+                "Instructor %s teaches %s at once at %s" % 
+                (cands.instructors[prof], _names(cands, prof_courses), its)))
+    return findings
+
+def _conflictGroups(cands, noConflictGroups):
+    """(name, boolean array over courses) of each no conflict group, as in build()"""
+    groups = []
+    for cnst_name, course_nums in sorted((noConflictGroups or {}).items()):
+        names = [" ".join([num, sec, type]) for num, sec, type in course_nums]
+        groups.append((cnst_name, cands.coursesNamed(names)))
+    return groups
+
+def _conflicts(cands, its, courses, groups):
+    """Several courses of a no conflict group at once, or of a lecture and its
+    recitations, as addAllNoConflictGroups and lectureRecitationConstraints"""
+    findings = []
+    for cnst_name, in_group in groups:
+        group_courses = courses[in_group[courses]].tolist()
+        if len(group_courses) > 1:
+            findings.append(("no conflict %s" % cnst_name, group_courses,
+                "No conflict group %s has %s at once at %s" %
+                (cnst_name.strip(), _names(cands, group_courses), its)))
+
+    #breakouts meet with their lectures.  The row exists since a recitation is here
+    courses = courses[~cands.is_breakout[courses]]
+    for lecrec in np.unique(cands.lecrec_ix[courses[cands.is_rec[courses]]]).tolist():
+        lecrec_courses = courses[cands.lecrec_ix[courses] == lecrec].tolist()
+        if len(lecrec_courses) > 1:
+            findings.append(("lec-rec", lecrec_courses,
+                "Lecture and recitations %s meet at once at %s" %
+                (_names(cands, lecrec_courses), its)))
+    return findings
+
+def _roomCapacity(cands, its, courses, room_masks):
+    """More courses at once than the rooms they can use, as atMostOneCourseConstraints.
+    Checks Hall's condition for the courses whose rooms are among those of one of 
+    them, and for all of them.  room_masks caches the rooms of each course as a bitmask"""
+    for k in courses.tolist():
+        if k not in room_masks:
+            rooms = np.unique(cands.room_ix[cands.candidatesOfCourse(k)]).tolist()
+            room_masks[k] = sum(1 << r for r in rooms)
+    masks = [room_masks[k] for k in courses.tolist()]
+
+    findings = []
+    for mask in set(masks + [reduce(lambda m1, m2: m1 | m2, masks)]):
+        members = [k for k, m in zip(courses.tolist(), masks) if not m & ~mask]
+        rooms = [r for r in xrange(mask.bit_length()) if mask >> r & 1]
+        capacity = cands.room_size[rooms].sum()
+        if len(members) > capacity:
+            findings.append(("rooms", members,
+                "Courses %s need more than the %d rooms %s at %s" % (_names(cands, members), 
+                        capacity, ", ".join(str(cands.rooms[r]) for r in rooms), its)))
+    return findings
@@ -27,15 +27,27 @@ def uniquify(items):
             out.append(i)
     return out        
         
-class Room:
+def _getSlotState(obj):
+    """Pickle state of a __slots__ instance less its cached hash.  
+    String hashes can differ between processes, so they are recomputed on load."""
+    return dict((k, getattr(obj, k)) for k in obj.__slots__ 
+                if k <> "_hash" and hasattr(obj, k))
+
+def _setSlotState(obj, state):
+    for k, v in state.iteritems():
+        setattr(obj, k, v)
+
+class Room(object):
     """A room in a bldg.
     Attributes:
         bldg
         roomNum
         capacity
         AV - list of av facilities
+        key - (bldg, roomNum) used for equality and hashing
     """
     MAX_SIZE = 200
+    __slots__ = ("bldg", "roomNum", "capacity", "AV", "key", "_hash")
 
     @staticmethod
     def isValidRoomName(sName):
@@ -53,6 +65,8 @@ class Room:
         sName = sName.strip().split("-")
         sName = map(lambda s: s.strip().upper(), sName)
         self.bldg, self.roomNum = sName 
+        self.key = (self.bldg, self.roomNum)
+        self._hash = hash(self.key)
 
         if int(capacity) <= 0:
             raise SESError("Room %s has nonpositive capcity" % self)
@@ -65,17 +79,26 @@ class Room:
                              specified as list of strings" % self )         
 
     def __eq__(self, other):
+        if isinstance(other, Room):
+            return self.key == other.key
         return self.__str__() == other.__str__()
     
     def __ne__(self, other):
-        return self.__str__() <> other.__str__()
+        return not self == other
 
     def __str__(self):
         """Provide room string in 'E51-31' format"""
         return self.bldg + "-" + self.roomNum
 
     def __hash__(self):
-        return hash(self.__str__())
+        return self._hash
+
+    def __getstate__(self):
+        return _getSlotState(self)
+
+    def __setstate__(self, state):
+        _setSlotState(self, state)
+        self._hash = hash(self.key)
 
     def isInBldg(self, bldg2):
         """Test if room is in given building."""
@@ -136,7 +159,7 @@ class Half:
 
 #---------------------------------------------
 
-class TimeSlot:
+class TimeSlot(object):
     """Primitive TimeSlot Object
     Class Attributes
     daysOfWeek list of "M", "T", etc.
@@ -146,10 +169,30 @@ class TimeSlot:
     days - list of 
     startTime - stored as datetime.datetime object
     endTime - stored as a datetime.datetime object
+    startMin, endMin - start and end as integer minutes after midnight
+    dayMask - bit d set iff meets on daysOfWeek[d]
+    mask - occupancy bitmask over (half, day, 5 min cell).  Bit 
+        (h * 5 + d) * CELLS_PER_DAY + c set iff meets during cell c of day d 
+        in half h (0 = H1, 1 = H2).  Full semester slots occupy both halves.
+    onGrid - True if start and end fall on cell boundaries, i.e. mask is exact
+    key - canonical (half, days, startTime, endTime) used for equality and hashing
 
     When times specified as strings, should be as '10:30 AM'
+    TimeSlots should be treated as immutable;  use TimeSlot.interned to share 
+    a single instance amongst all courses.
     """    
     daysOfWeek = ["M", "T", "W", "Th", "F"]
+    CELL_MIN = 5
+    CELLS_PER_DAY = 24 * 60 // CELL_MIN
+    B2B_GAP = 5   #minutes
+    LUNCH_START, LUNCH_END = 11 * 60 + 30, 13 * 60
+
+    #instants used by meetsDuring2, keyed by (half, day, sTime)
+    _instants = {}
+    
+    #interned instances by the raw arguments and by canonical key
+    _interned = {}
+    _canonical = {}
     
     @staticmethod
     def str2time(s):
@@ -161,6 +204,19 @@ class TimeSlot:
         """returns a 10:30 am string from a datetime object"""
         return dt.strftime("%I:%M %p")
 
+    @staticmethod
+    def interned(half, dayString, startTime, endTime):
+        """Return the shared TimeSlot for these arguments, creating it if needed.
+        Equal slots are the same instance, so comparisons short-circuit on identity.
+        """
+        raw_key = (str(half), dayString, startTime, endTime)
+        ts = TimeSlot._interned.get(raw_key)
+        if ts is None:
+            ts = TimeSlot(half, dayString, startTime, endTime)
+            ts = TimeSlot._canonical.setdefault(ts.key, ts)
+            TimeSlot._interned[raw_key] = ts
+        return ts
+
     def __init__(self, half, dayString, startTime, endTime):
         """Create a time slot.  
         dayString whitespace separated like 'M W F'.
@@ -194,18 +250,38 @@ class TimeSlot:
         if self.startTime >= self.endTime:
             raise SESError("Start Time after End Time: %s %s" % (startTime, endTime) )
 
+        self.startMin = self.startTime.hour * 60 + self.startTime.minute
+        self.endMin = self.endTime.hour * 60 + self.endTime.minute
+        self.dayMask = sum(1 << TimeSlot.daysOfWeek.index(d) for d in set(self.days))
+        self.mask = self._occupancy()
+        self.onGrid = not (self.startMin % self.CELL_MIN or self.endMin % self.CELL_MIN or 
+                           self.startTime.second or self.endTime.second)
+        self.key = (self.half.half, tuple(self.days), self.startTime, self.endTime)
+        self._hash = hash(self.key)
+
+    def _occupancy(self):
+        """Occupancy bitmask.  Cells partially covered count as occupied"""
+        first = self.startMin // self.CELL_MIN
+        last = -(-self.endMin // self.CELL_MIN)  #ceiling
+        cells = ((1 << (last - first)) - 1) << first
+        halves = [0, 1] if self.half.isFull() else [Half.halfSemesters.index(self.half.half)]
+        mask = 0
+        for h in halves:
+            for d in range(len(TimeSlot.daysOfWeek)):
+                if self.dayMask >> d & 1:
+                    mask |= cells << (h * len(TimeSlot.daysOfWeek) + d) * self.CELLS_PER_DAY
+        return mask
+
     def overlap(self, timeSlot2):
         """Test if two time slots overlap.
             Logic presumes that classes run from [startTime, endTime) """
-        if (self.endTime <= timeSlot2.startTime or
-           timeSlot2.endTime <= self.startTime):
-           return False
-        elif not(set(self.days) & set(timeSlot2.days)): #check days
-            return False
-        elif not self.half.overlap(timeSlot2.half):
+        if not self.mask & timeSlot2.mask:
             return False
-        else:
+        elif self.onGrid and timeSlot2.onGrid:
             return True
+        #off the grid cells are over-approximated, so compare exactly
+        return not (self.endTime <= timeSlot2.startTime or
+                    timeSlot2.endTime <= self.startTime)
             
     #Try to deprecate this
     def meetsDuring(self, sTime):
@@ -217,10 +293,12 @@ class TimeSlot:
         
     def meetsDuring2(self, half, day, sTime):
         """Test if time slot overlaps given instant"""
-        t = self.str2time(sTime)
-        five_min = datetime.timedelta(minutes=5)
-        t_p = t + five_min
-        return self.overlap(TimeSlot(half, day, sTime, t_p))
+        key = (str(half), day, sTime)
+        instant = TimeSlot._instants.get(key)
+        if instant is None:
+            t_p = self.str2time(sTime) + datetime.timedelta(minutes=5)
+            instant = TimeSlot._instants[key] = TimeSlot.interned(half, day, sTime, t_p)
+        return self.overlap(instant)
 
     def meetingsPerWk(self):
         """Returns the number of meetings per week"""
@@ -232,26 +310,25 @@ class TimeSlot:
 
     def isB2B(self, ts):
         """Is ts a back2back slot?  Ignores semester info"""
-        if not set(self.days).issubset(ts.days) and not set(self.days).issuperset(ts.days):
+        common = self.dayMask & ts.dayMask
+        if common <> self.dayMask and common <> ts.dayMask:
             return False
 
-        five_min = datetime.timedelta(minutes=5)
-        
         #self starts just after ts
-        if self.startTime >= ts.endTime and (self.startTime - ts.endTime) <= five_min:
+        if 0 <= self.startMin - ts.endMin <= self.B2B_GAP:
             return True
         
         #ts starts just after self
-        if ts.startTime >= self.endTime and (ts.startTime - self.endTime) <= five_min:
+        if 0 <= ts.startMin - self.endMin <= self.B2B_GAP:
             return True
         
         #Have to do an oddity to account for lunch
-        if ((self.str2time("11:30 AM") <= self.endTime <= self.str2time("1:00 PM")) and
-            (self.endTime <= ts.startTime <= self.str2time("1:00 PM")) ):
+        if (self.LUNCH_START <= self.endMin <= self.LUNCH_END and
+            self.endMin <= ts.startMin <= self.LUNCH_END):
             return True
 
-        if ((self.str2time("11:30 AM") <= ts.endTime <= self.str2time("1:00 PM")) and
-            (ts.endTime <= self.startTime <= self.str2time("1:00 PM")) ):
+        if (self.LUNCH_START <= ts.endMin <= self.LUNCH_END and
+            ts.endMin <= self.startMin <= self.LUNCH_END):
             return True
             
         return False        
@@ -263,17 +340,25 @@ class TimeSlot:
                                  self.time2str(self.endTime))
                                 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return self is other or self.key == other.key
 
     def __ne__(self, other):
         return not self == other
         
     def __hash__(self):
-        return hash(self.__str__())
+        return self._hash
+
+    def __reduce__(self):
+        #unpickle through the intern table, which also recomputes the hash
+        return (_internedTimeSlot, (self.half.half, " ".join(self.days), 
+                                    self.startTime, self.endTime))
+
+def _internedTimeSlot(half, dayString, startTime, endTime):
+    return TimeSlot.interned(half, dayString, startTime, endTime)
                 
 #---------------------------------------------
 
-class Instructor:
+class Instructor(object):
     """Encapsulates Prof Info.  
     Teams should be entered under a specific instructor.
     We assume no "blanks" on the outside.
@@ -281,6 +366,8 @@ class Instructor:
     Attributes:
     name - stored as upper case, used as identifier
     """
+    __slots__ = ("name", "key", "_hash")
+
     def __init__(self, instructorName):
         assert isinstance(instructorName, str)
         if instructorName == "":
@@ -288,6 +375,8 @@ class Instructor:
             instructorName = str(uid())
             
         self.name = instructorName.strip().upper()
+        self.key = self.name
+        self._hash = hash(self.key)
     
     def __str__(self):
         return str(self.name)
@@ -300,11 +389,18 @@ class Instructor:
 
     #Assumes unique names for instructors
     def __hash__(self):
-        return hash(self.name)
+        return self._hash
+
+    def __getstate__(self):
+        return _getSlotState(self)
+
+    def __setstate__(self, state):
+        _setSlotState(self, state)
+        self._hash = hash(self.key)
 
 #---------------------------------------------
 
-class Course:
+class Course(object):
     """ Single course.  
     Contains a fair amount of logic and functionality.  
     Assumes that the triplet "number, section, classtype" is unique.
@@ -325,11 +421,17 @@ class Course:
         assignedRoom - room Instance or None if not yet known
         assignedTime - timeSlot Instance or None if not yet known
         extraInstructors - 
+        key - (number, section, classtype) used for equality and hashing
     """
     #Move this to a config file.  
     SOFT_CAPACITY= .1
     MAX_ECAP = .5
 
+    __slots__ = ("number", "dept", "enrollment", "instructor", "section", "classtype", 
+                 "title", "av_requirements", "respectTime", "respectRoom", 
+                 "roomPrefs", "timePrefs", "assignedRoom", "assignedTime", 
+                 "extraInstructors", "pref_days", "key", "_hash")
+
     def __init__(self, courseNumber, dept, enrollment, instructor,
                     firstTimePref, respectTime = False, 
                     section="", classtype = "LEC", title ="", 
@@ -367,6 +469,8 @@ class Course:
         self.section, self.title, self.respectRoom, self.respectTime = ( 
                 section.strip().upper(), title.strip(), False, respectTime )
         self.classtype = classtype.strip().upper()
+        self.key = (self.number, self.section, self.classtype)
+        self._hash = hash(self.key)
 
         is_valid_type = False
         for type in ("LEC", "REC", "BREAKOUT"):
@@ -391,10 +495,22 @@ class Course:
         return " ".join([self.number, self.section, self.classtype])
 
     def __eq__(self, other):
+        if isinstance(other, Course):
+            return self.key == other.key
         return str(self) == str(other)
     
     def __ne__(self, other):
-        return str(self) <> str(other)
+        return not self == other
+
+    def __hash__(self):
+        return self._hash
+
+    def __getstate__(self):
+        return _getSlotState(self)
+
+    def __setstate__(self, state):
+        _setSlotState(self, state)
+        self._hash = hash(self.key)
 
     def addExtraInstructors(self, instructors):
         """Add additional instructors to the course.  For team teaching"""
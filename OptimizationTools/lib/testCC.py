@@ -4,6 +4,7 @@ All unit tests for the course calculator.  Excludes tests of the GUI
 
 """
 import unittest
+import os, shutil, tempfile
 import courseCalculator as cc
 import readData
 from wx.lib.pubsub import Publisher as pub
@@ -11,6 +12,13 @@ from sesClasses import SESError
 from sesClasses import TimeSlot
 
 
+#the CBC backend needs pulp
+try:
+    import pulp
+    _HAS_PULP = True
+except ImportError:
+    _HAS_PULP = False
+
 #simple couple lines for checking when warnings are thrown
 global _hasMsg
 _hasMsg = False
@@ -30,6 +38,15 @@ def hasMsg():
 #set up pubsub subscriber to test warnings
 pub.subscribe(updateMsg, "warning")
 
+def loadModel(course_file="./TestFiles/room_not_in_inv_respect1.csv", config_details=None):
+    """Quiet SESModel with course_file and the small test inventory loaded"""
+    model = cc.SESModel(quiet=True, config_details=config_details)
+    model.setData(course_file,
+            "./TestFiles/roominventory1.csv",
+            "./TestFiles/NoConflict1.csv",
+            "./TestFiles/blank_b2b.csv")
+    return model
+
 
 class TestReadData(unittest.TestCase):
     """Series of tests that test the readData Funcitonality"""
@@ -60,6 +77,63 @@ class TestReadData(unittest.TestCase):
         self.assertRaises(SESError, readData.importCourses, 
                 "./TestFiles/breakout_no_partner1.csv", roomInventory)
 
+    def test_indexes(self):
+        """Courses and rooms resolve by normalized key"""
+        roomInventory = readData.importRoomInventory("./TestFiles/roominventory1.csv")
+        courses = readData.importCourses("./TestFiles/breakout1.csv", roomInventory)
+        course_index = readData.CourseIndex(courses)
+        self.assertEqual(str(course_index.get("15.s03 ", "", "breakout")), "15.S03  BREAKOUT")
+        self.assertEqual(str(course_index.get("15.012", "b", "")), "15.012 B LEC")
+        self.assertTrue(course_index.get("15.012", "D", "LEC") is None)
+
+        room_index = readData.RoomIndex(roomInventory)
+        self.assertTrue(room_index.get(" e51-057") is roomInventory[0])
+        self.assertTrue(room_index.get("E51-000") is None)
+
+    def test_dataset_cache(self):
+        """Reloading unchanged files uses the snapshot and replays warnings"""
+        cache_dir = tempfile.mkdtemp()
+        try:
+            paths = ("./TestFiles/room_not_in_inv1.csv", "./TestFiles/roominventory1.csv",
+                     "./TestFiles/NoConflict1.csv", "./TestFiles/blank_b2b.csv")
+            rooms, courses, no_conflicts, b2b_pairs = readData.importDataset(*paths, 
+                                                            cache_dir=cache_dir)
+            self.assertTrue(hasMsg())
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+            rooms2, courses2, no_conflicts2, b2b_pairs2 = readData.importDataset(*paths, 
+                                                            cache_dir=cache_dir)
+            self.assertTrue(hasMsg())
+            self.assertEqual(courses, courses2)
+            self.assertEqual(rooms, rooms2)
+            self.assertEqual(no_conflicts, no_conflicts2)
+            self.assertEqual(set(c.timePrefs[0] for c in courses), 
+                             set(c.timePrefs[0] for c in courses2))
+        finally:
+            shutil.rmtree(cache_dir)
+
+    @unittest.skipIf(not hasattr(os, "getuid"), "no file ownership")
+    def test_dataset_cache_private(self):
+        """Snapshots are private to the user, and a shared cache dir is not used"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        paths = ("./TestFiles/room_not_in_inv1.csv", "./TestFiles/roominventory1.csv",
+                 "./TestFiles/NoConflict1.csv", "./TestFiles/blank_b2b.csv")
+        snapshot_dir = os.path.join(cache_dir, "cache")
+        readData.importDataset(*paths, cache_dir=snapshot_dir)
+        self.assertEqual(os.stat(snapshot_dir).st_mode & 0o777, 0o700)
+        snapshots = os.listdir(snapshot_dir)
+        self.assertEqual(len(snapshots), 1)
+        self.assertEqual(os.stat(os.path.join(snapshot_dir, snapshots[0])).st_mode & 0o077, 0)
+
+        shared_dir = os.path.join(cache_dir, "shared")
+        os.mkdir(shared_dir)
+        os.chmod(shared_dir, 0o777)
+        rooms, courses, no_conflicts, b2b_pairs = readData.importDataset(*paths, 
+                                                        cache_dir=shared_dir)
+        self.assertTrue(courses)
+        self.assertEqual(os.listdir(shared_dir), [])
+
     def test_unknown_b2b(self):
         """Specifying b2b constraints for a course that is not scheduled should
         yield a warning, and then constraint ignored."""
@@ -233,6 +307,374 @@ class TestCC(unittest.TestCase):
         self.assertTrue(r.sameFloor(c.assignedRoom))
         self.assertEqual(c.assignedTime, TimeSlot("", "T", "4:00 PM", "7:00 PM"))
 
+    def test_warm_start(self):
+        """Re-solves start from the previous assignment"""
+        model = loadModel()
+        model.setWeights([2, 1, 0], 1, 0, 0, 0, 0)
+        self.assertEqual(model.optimizer.mipStart(), None)
+
+        model.optimize()
+        assignment = [(c.assignedRoom, c.assignedTime) for c in model.courses]
+        cols, values = model.optimizer.mipStart()
+        self.assertEqual(len(cols), len(values))
+        self.assertEqual(sum(values), len(model.courses))
+
+        model.optimize()
+        self.assertEqual(assignment,
+                [(c.assignedRoom, c.assignedTime) for c in model.courses])
+
+    def test_heuristic(self):
+        """Preview schedules keep the hard constraints, and warm start the solve"""
+        from heuristic import HeuristicScheduler
+        model = loadModel("./TestFiles/breakout1.csv")
+        weights = ([2, 1, 0], 1, 1, 1, 1, 0)
+        model.setWeights(*weights)
+        model.preview()
+        self.assertNotEqual(model.optimizer.mipStart(), None)
+        courses = model.courses
+        for c in courses:
+            for c2 in courses:
+                if c is not c2 and c.assignedTime.overlap(c2.assignedTime):
+                    self.assertNotEqual(c.assignedRoom, c2.assignedRoom)
+                    self.assertFalse(set(c.getInstructors()) & set(c2.getInstructors()))
+        lec = [c for c in courses if c.isSame("15.S03", "", "")][0]
+        breakout = [c for c in courses if c.isSame("15.S03", "", "Breakout")][0]
+        self.assertEqual(lec.assignedTime, breakout.assignedTime)
+        self.assertEqual(lec.assignedRoom.roomNum[0], breakout.assignedRoom.roomNum[0])
+
+        heuristic = HeuristicScheduler(model.optimizer)
+        heuristic.solve(*weights)
+        assignments = [(c.assignedRoom, c.assignedTime) for c in courses]
+        self.assertAlmostEqual(heuristic.objective, 
+                               model.optimizer.scheduleObjective(assignments, *weights))
+        model.optimize()
+        self.assertTrue(heuristic.objective <= model.optimizer.objectiveValue(*weights) + 1e-6)
+
+        #out of time before every course is placed
+        self.assertRaises(SESError, heuristic.solve, *weights, time_limit=-1)
+
+    def test_heuristic_start_fails(self):
+        """The solve goes on without the warm start if the heuristic fails"""
+        import config
+        config_details = config.Options()
+        config_details.HEURISTIC_START, config_details.HEURISTIC_SECONDS = True, -1
+        model = loadModel("./TestFiles/breakout1.csv", config_details=config_details)
+        model.setWeights([2, 1, 0], 1, 1, 1, 1, 0)
+        model.optimize()
+        self.assertTrue(hasMsg())
+        self.assertTrue(all(c.assignedRoom is not None and c.assignedTime is not None
+                            for c in model.courses))
+
+    def test_reoptimize(self):
+        """Re-solving around a changed course keeps the rest of the schedule"""
+        model = loadModel("./TestFiles/breakout1.csv")
+        model.setWeights([2, 1, 0], 1, 1, 1, 1, 0)
+        model.optimize()
+        courses = model.optimizer.getCourses()
+        assignment = [(c.assignedRoom, c.assignedTime) for c in courses]
+
+        k = [ix for ix, c in enumerate(courses) if c.isSame("15.014", "A", "")][0]
+        self.assertEqual(model.optimizer.neighborhood([k], "INSTRUCTOR"), [k])
+        self.assertEqual([courses[ix].dept for ix in model.optimizer.neighborhood([k], "DEPT")], 
+                         ["ECONOMICS"] * 4)
+        self.assertRaises(ValueError, model.optimizer.neighborhood, [k], "ROOM")
+
+        #nothing changed, so nothing to solve
+        self.assertEqual(model.optimizer.reoptimize([], [2, 1, 0], 1, 1, 1, 1, 0), 0)
+        model.reoptimize([])
+        self.assertEqual(assignment, [(c.assignedRoom, c.assignedTime) for c in courses])
+
+        #a late change the old schedule does not allow
+        courses[k].assignedRoom, courses[k].assignedTime = None, None
+        model.reoptimize([])
+        self.assertTrue(courses[k].assignedTime is not None)
+        for ix, c in enumerate(courses):
+            if c.dept <> "ECONOMICS":
+                self.assertEqual(assignment[ix], (c.assignedRoom, c.assignedTime))
+
+        #bounds are released afterwards
+        optimizer = model.optimizer
+        self.assertTrue((optimizer.col_lb == optimizer.model_lb).all())
+        self.assertTrue((optimizer.col_ub == optimizer.model_ub).all())
+
+    def test_reoptimize_retrieve(self):
+        """The solution is still retrieved after reoptimize releases the bounds"""
+        model = loadModel()
+        weights = ([2, 1, 0], 1, 1, 1, 1, 0)
+        model.setWeights(*weights)
+        model.optimize()
+        optimizer = model.optimizer
+        courses = optimizer.getCourses()
+        courses[1].assignedRoom, courses[1].assignedTime = None, None
+        self.assertTrue(optimizer.reoptimize([1], *weights) > 0)
+        assignment = [(c.assignedRoom, c.assignedTime) for c in optimizer.retrieveAssignment()]
+        self.assertTrue(assignment[1][1] is not None)
+        self.assertEqual(assignment, [(c.assignedRoom, c.assignedTime) for c in courses])
+
+    def test_stability(self):
+        """With a stability weight, courses keep the room and time of the reference"""
+        model = loadModel("./TestFiles/breakout1.csv")
+        model.setWeights([2, 1, 0], 1, 1, 1, 1, 0)
+        model.optimize()
+        reference = [(c.assignedRoom, c.assignedTime) for c in model.courses]
+        model.optimizer.setReference(reference)
+
+        #excess capacity alone would move some courses
+        weights = ([1, 0, 0], 0, 10, 0, 0, 0, 10)
+        model.setWeights(*weights)
+        model.optimize()
+        self.assertEqual(reference, [(c.assignedRoom, c.assignedTime) for c in model.courses])
+        self.assertAlmostEqual(model.optimizer.objectiveValue(*weights), 
+                               model.optimizer.objectiveValue(*weights[:-1]))
+
+    def test_lns_new_weights(self):
+        """With config LNS, a complete schedule is solved in full for new weights"""
+        import config
+        config_details = config.Options()
+        config_details.LNS = True
+        model = loadModel("./TestFiles/breakout1.csv", config_details=config_details)
+        model.setWeights([2, 1, 0], 1, 1, 1, 1, 0)
+        model.optimize()
+
+        published = []
+        listener = lambda message: published.append(message.data)
+        pub.subscribe(listener, "status_bar")
+        try:
+            model.setWeights([1, 0, 0], 0, 10, 0, 0, 0)
+            model.optimize()
+            self.assertEqual(published[-1], "Optimization completed")
+            model.optimize()
+            self.assertEqual(published[-1], "Optimization completed")
+
+            #the same weights and nothing changed, so the schedule is kept
+            model.reoptimize([])
+            self.assertEqual(published[-1], "Nothing to re-optimize. Kept the current schedule")
+        finally:
+            pub.unsubscribe(listener)
+
+    def test_optimize_async(self):
+        """Background optimization matches the synchronous one, and can be cancelled"""
+        model = loadModel()
+        model.setWeights([2, 1, 0], 1, 0, 0, 0, 0)
+        model.optimize()
+        assignment = [(c.assignedRoom, c.assignedTime) for c in model.courses]
+
+        messages = []
+        def callAfter(f, topic, data):
+            messages.append(topic)
+            f(topic, data)
+        model.optimizeAsync(callAfter).join()
+        self.assertFalse(model.isOptimizing())
+        self.assertEqual(messages[0], "optimization_started")
+        self.assertEqual(messages[-2:], ["assignments_calced", "optimization_finished"])
+        self.assertEqual(assignment,
+                [(c.assignedRoom, c.assignedTime) for c in model.courses])
+
+        #cancelling during the build never reaches the solver
+        model = loadModel()
+        model.setWeights([2, 1, 0], 1, 0, 0, 0, 0)
+        messages = []
+        def cancelOnBuild(f, topic, data):
+            messages.append(topic)
+            if data == "Building optimization...":
+                model.cancelOptimize()
+            f(topic, data)
+        model.optimizeAsync(cancelOnBuild).join()
+        self.assertTrue("status_bar.error" in messages)
+        self.assertFalse("assignments_calced" in messages)
+
+    def test_preview_async(self):
+        """Background preview matches the synchronous one"""
+        model = loadModel()
+        model.setWeights([2, 1, 0], 1, 1, 1, 1, 0)
+        model.preview()
+        assignment = [(c.assignedRoom, c.assignedTime) for c in model.courses]
+        for c in model.courses:
+            c.assignedRoom, c.assignedTime = None, None
+
+        messages = []
+        def callAfter(f, topic, data):
+            messages.append(topic)
+            f(topic, data)
+        model.previewAsync(callAfter).join()
+        self.assertFalse(model.isOptimizing())
+        self.assertEqual(messages[0], "optimization_started")
+        self.assertEqual(messages[-2:], ["assignments_calced", "optimization_finished"])
+        self.assertEqual(assignment,
+                [(c.assignedRoom, c.assignedTime) for c in model.courses])
+
+    def test_solver_progress(self):
+        """Progress is recorded on the optimizer and published"""
+        model = loadModel()
+        model.setWeights([2, 1, 0], 1, 1, 1, 1, 0)
+        published = []
+        listener = lambda message: published.append(message.data)
+        pub.subscribe(listener, "solver_progress")
+        try:
+            model.optimize()
+        finally:
+            pub.unsubscribe(listener)
+
+        progress = model.solverProgress()
+        self.assertTrue(progress)
+        self.assertEqual(published, progress)
+        elapsed, incumbent, bound, gap, nodes = progress[-1]
+        self.assertTrue(incumbent is not None)
+        self.assertTrue(gap <= model.optimizer.config.REL_GAP + 1e-6)
+
+    def test_sweep_weights(self):
+        """Sweep solves every weight setting and flags the pareto efficient ones"""
+        model = loadModel()
+        weight_list = cc.weightGrid([[1, 0, 0]], [1], [0, 10], [0, 10], [1], [0])
+        self.assertEqual(len(weight_list), 4)
+        rows = model.sweepWeights(weight_list, processes=2)
+        self.assertEqual([row["weights"] for row in rows], weight_list)
+        self.assertTrue(all(row["error"] is None for row in rows))
+        self.assertTrue(any(row["pareto"] for row in rows))
+
+        model.setWeights(*weight_list[1])
+        model.optimize()
+        self.assertAlmostEqual(rows[1]["excess_cap"], model.summarizeExcessCap())
+
+        #min dept score is scored with the swept score weights
+        model.setWeights([2, 1, 0], 1, 0, 0, 1, 0)
+        model.optimize()
+        self.assertAlmostEqual(model.weightMetrics(([2, 1, 0], 1, 0, 0, 1, 0))["min_dept_score"],
+                               min(model.getDeptFairnessScores([2, 1, 0]).values()))
+
+    def test_sweep_decomposed(self):
+        """The decomposed solve runs its rooms stage serially in the sweep workers"""
+        import config
+        config_details = config.Options()
+        config_details.DECOMPOSE, config_details.DECOMPOSE_PROCESSES = True, None
+        model = loadModel(config_details=config_details)
+        self.assertTrue(model.optimizer.config.DECOMPOSE)
+        rows = model.sweepWeights(cc.weightGrid([[1, 0, 0]], [1], [0, 10], [0], [0], [0]), 
+                                  processes=2)
+        self.assertEqual([row["error"] for row in rows], [None, None])
+
+    def test_flag_pareto(self):
+        rows = [{"error":None, "a":1, "b":1}, {"error":None, "a":2, "b":0},
+                {"error":None, "a":0, "b":0}, {"error":"Failed"}]
+        cc.flagPareto(rows, (("a", 1), ("b", 1)))
+        self.assertEqual([row["pareto"] for row in rows], [True, True, False, False])
+
+    def test_aggregate_rooms(self):
+        """Aggregated rooms give the same optimum with fewer binaries"""
+        import config, optimizer as opt
+        rooms = readData.importRoomInventory("./TestFiles/roominventory1.csv")
+        results = []
+        for aggregate in (False, True):
+            courses = readData.importCourses("./TestFiles/room_not_in_inv_respect1.csv", rooms)
+            config_details = config.Options()
+            config_details.AGGREGATE_ROOMS = aggregate
+            optimizer = opt.Optimizer(courses, rooms, config_details, quiet=True)
+            optimizer.build()
+            optimizer.updateObjFcnAndSolve([1, 0, 0], 1, 1, 1, 0, 0)
+            results.append((optimizer.numCols(),
+                            optimizer.objectiveValue([1, 0, 0], 1, 1, 1, 0, 0),
+                            optimizer.retrieveAssignment()))
+
+        self.assertTrue(results[1][0] < results[0][0])
+        self.assertAlmostEqual(results[0][1], results[1][1], places=4)
+        courses = results[1][2]
+        for c in courses:
+            self.assertTrue(c.assignedRoom in rooms or c.assignedRoom in c.roomPrefs)
+            for c2 in courses:
+                if c is not c2 and c.assignedTime.overlap(c2.assignedTime):
+                    self.assertNotEqual(c.assignedRoom, c2.assignedRoom)
+
+    def test_presolve(self):
+        """Presolve fixes the courses with one candidate and keeps the optimum"""
+        import config, optimizer as opt
+        rooms = readData.importRoomInventory("./TestFiles/roominventory1.csv")
+        results = []
+        for presolve in (False, True):
+            courses = readData.importCourses("./TestFiles/room_not_in_inv_respect1.csv", rooms)
+            courses[0].respectTime = True
+            config_details = config.Options()
+            config_details.PRESOLVE = presolve
+            optimizer = opt.Optimizer(courses, rooms, config_details, quiet=True)
+            optimizer.build()
+            optimizer.updateObjFcnAndSolve([1, 0, 0], 1, 1, 1, 0, 0)
+            results.append((optimizer.numRows(), len(optimizer.A_data),
+                            optimizer.objectiveValue([1, 0, 0], 1, 1, 1, 0, 0), optimizer))
+
+        self.assertTrue(results[1][0] < results[0][0])
+        self.assertTrue(results[1][1] < results[0][1])
+        self.assertAlmostEqual(results[0][2], results[1][2], places=4)
+        optimizer = results[1][3]
+        fixed = optimizer.cands.candidatesOfCourse(0)
+        self.assertEqual(len(fixed), 1)
+        self.assertEqual((optimizer.model_lb[fixed[0]], optimizer.model_ub[fixed[0]]), (1, 1))
+        self.assertFalse(fixed[0] in optimizer.A_indices)
+        self.assertEqual(len(optimizer.full_rows[3]), results[0][0])
+
+    def test_aggregate_rooms_multi_day(self):
+        """Times overlapping pairwise on different days fit a room class at every 
+        instant, but not its rooms.  The rooms are then decided over every room"""
+        import config, optimizer as opt
+        rooms = readData.importRoomInventory("./TestFiles/roomInventory_multi_day1.csv")
+        courses = readData.importCourses("./TestFiles/multi_day1.csv", rooms)
+        config_details = config.Options()
+        config_details.AGGREGATE_ROOMS = True
+        optimizer = opt.Optimizer(courses, rooms, config_details, quiet=True)
+        optimizer.build()
+        self.assertEqual(len(optimizer.cands.roomMembers(0)), 2)
+        optimizer.updateObjFcnAndSolve([1, 0, 0], 1, 10, 0, 0, 0)
+        self.assertEqual(optimizer.chosenRooms(), [0] * len(courses))
+
+        courses = optimizer.retrieveAssignment()
+        self.assertEqual(len(set(c.assignedRoom for c in courses)), 3)
+
+    def test_decomposed(self):
+        """Two-stage solve gives a valid schedule, no better than the monolithic model"""
+        import config, optimizer as opt
+        rooms = readData.importRoomInventory("./TestFiles/roominventory1.csv")
+        courses = readData.importCourses("./TestFiles/room_not_in_inv_respect1.csv", rooms)
+        config_details = config.Options()
+        config_details.DECOMPOSE, config_details.DECOMPOSE_PROCESSES = True, 2
+        optimizer = opt.Optimizer(courses, rooms, config_details, quiet=True)
+        optimizer.build()
+        optimizer.updateObjFcnAndSolve([1, 0, 0], 1, 1, 1, 0, 0)
+        self.assertTrue(len(optimizer.groups) > 1)
+        courses = optimizer.retrieveAssignment()
+        for c in courses:
+            self.assertTrue(c.assignedRoom in rooms or c.assignedRoom in c.roomPrefs)
+            self.assertTrue(c.isViableRoom(c.assignedRoom) or c.respectRoom)
+            for c2 in courses:
+                if c is not c2 and c.assignedTime.overlap(c2.assignedTime):
+                    self.assertNotEqual(c.assignedRoom, c2.assignedRoom)
+
+        obj, mono_obj, gap = optimizer.monolithicGap()
+        self.assertTrue(obj <= mono_obj * (1 + config_details.REL_GAP) + 1e-6)
+        self.assertAlmostEqual(gap, (mono_obj - obj) / abs(mono_obj))
+
+        #the monolithic objective of its own schedule is its solution value
+        monolithic = optimizer.monolithic
+        assignments = [(c.assignedRoom, c.assignedTime) for c in monolithic.retrieveAssignment()]
+        self.assertAlmostEqual(monolithic.scheduleObjective(assignments, [1, 0, 0], 1, 1, 1, 0, 0), 
+                               mono_obj, places=4)
+
+    def test_decomposed_warns_once(self):
+        """Two-stage solve publishes each warning once, as the monolithic model does"""
+        import config
+        for decompose in (False, True):
+            config_details = config.Options()
+            config_details.DECOMPOSE, config_details.DECOMPOSE_PROCESSES = decompose, 1
+            config_details.DATA_CACHE_DIR = None
+            published = []
+            listener = lambda message: published.append(message.data)
+            pub.subscribe(listener, "warning")
+            try:
+                model = loadModel("./TestFiles/room_not_in_inv1.csv", config_details)
+                model.setWeights([1, 0, 0], 1, 1, 1, 0, 0)
+                model.optimize()
+            finally:
+                pub.unsubscribe(listener)
+            self.assertTrue(published)
+            self.assertEqual(len(published), len(set(published)))
+
     def test_same_day(self):
         """Soft constraints that we maintain same requested day for things if possible"""
         pass
@@ -362,6 +804,44 @@ class TestCC(unittest.TestCase):
             Otherwise use it."""
         pass
 
+@unittest.skipIf(not _HAS_PULP, "pulp is unavailable")
+class TestCbc(unittest.TestCase):
+    def test_build_solve(self):
+        """The CBC backend solves a small model whatever the configured solver"""
+        import config
+        from optimizer_cbc import Optimizer
+        rooms = readData.importRoomInventory("./TestFiles/roominventory1.csv")
+        courses = readData.importCourses("./TestFiles/room_not_in_inv_respect1.csv", rooms)
+        config_details = config.Options()
+        config_details.SOLVER = "CBC"
+        optimizer = Optimizer(courses, rooms, config_details, quiet=True)
+        optimizer.build()
+        optimizer.updateObjFcnAndSolve([1, 0, 0], 1, 1, 1, 0, 0)
+        self.assertAlmostEqual(optimizer.progress[-1][1], 
+                               optimizer.objectiveValue([1, 0, 0], 1, 1, 1, 0, 0))
+
+        courses = optimizer.retrieveAssignment()
+        for c in courses:
+            self.assertTrue(c.assignedTime is not None)
+            for c2 in courses:
+                if c is not c2 and c.assignedTime.overlap(c2.assignedTime):
+                    self.assertNotEqual(c.assignedRoom, c2.assignedRoom)
+
+        #new weights replace the fairness rows, rather than adding to them
+        num_rows = len(optimizer.m.constraints)
+        optimizer.updateObjFcnAndSolve([1, 1, 0], 1, 1, 1, 1, 0)
+        self.assertEqual(len(optimizer.m.constraints), num_rows)
+        rows, cols, coefs = optimizer._fairnessRows([1, 1, 0])
+        values = optimizer._solutionValues()
+        for r in range(len(optimizer.getDepts())):
+            activity = sum(coefs[rows == r] * values[cols[rows == r]])
+            self.assertTrue(activity >= -1e-6)
+
+        dir_name = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_name)
+        optimizer.writeLP(os.path.join(dir_name, "ses"))
+        self.assertTrue(os.path.exists(os.path.join(dir_name, "ses.lp")))
+
 class TestOutput(unittest.TestCase):
     def setUp(self):
         global _hasMsg 
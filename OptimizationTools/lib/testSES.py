@@ -113,12 +113,26 @@ class TestTimeSlots(unittest.TestCase):
         self.assertFalse(self.time4.overlap(self.time5))
         self.assertFalse(self.time4.overlap(self.time6))
         
+    def test_overlap_offgrid(self):
+        #times off the 5 minute grid share a cell without overlapping
+        ts1 = TimeSlot("F", "M", "10:00 AM", "10:32 AM")
+        ts2 = TimeSlot("H1", "M W", "10:33 AM", "11:00 AM")
+        self.assertFalse(ts1.overlap(ts2))
+        self.assertFalse(ts2.overlap(ts1))
+        self.assertTrue(ts1.overlap(TimeSlot("H2", "M", "10:31 AM", "10:33 AM")))
         
     def test_during(self):
         self.assertTrue(self.time1.meetsDuring("11:00 AM"))
         self.assertFalse(self.time1.meetsDuring("12:00 PM"))
         self.assertFalse(self.time1.meetsDuring("12:01 PM"))
 
+    def test_during2(self):
+        self.assertTrue(self.time1.meetsDuring2("H2", "W", "11:55 AM"))
+        self.assertFalse(self.time1.meetsDuring2("H1", "T", "11:00 AM"))
+        self.assertFalse(self.time1.meetsDuring2("F", "M", "12:00 PM"))
+        self.assertTrue(self.time5.meetsDuring2("F", "T", "10:45 AM"))
+        self.assertFalse(self.time5.meetsDuring2("H1", "T", "10:45 AM"))
+
     def test_equality(self):
         time1_copy = TimeSlot("F", "M W F", "10:30 AM", "12:00 PM")
         self.assertTrue(self.time1 == time1_copy)
@@ -126,6 +140,13 @@ class TestTimeSlots(unittest.TestCase):
         self.assertFalse(self.time1 <> time1_copy)
         self.assertTrue(self.time2 <> time1_copy)
 
+    def test_interned(self):
+        ts = TimeSlot.interned("F", "M W F", "10:30 AM", "12:00 PM")
+        self.assertTrue(ts is TimeSlot.interned("", "M W F", "10:30 am", "12:00 PM"))
+        self.assertTrue(ts == self.time1)
+        self.assertEqual(hash(ts), hash(self.time1))
+        self.assertFalse(ts is TimeSlot.interned("H1", "M W F", "10:30 AM", "12:00 PM"))
+
     def test_meetingsPerWk(self):
         self.assertEqual(3, self.time1.meetingsPerWk())
         self.assertEqual(1, self.time2.meetingsPerWk())
@@ -202,6 +223,13 @@ class TestCourse(unittest.TestCase):
         self.assertTrue(self.course1.number == "15.051 J")
         self.assertTrue(self.course1.av_requirements[0] == "PROJECTOR")
         
+    def test_hash(self):
+        course1b = Course(" 15.051 J", "Finance", 45, self.dimitris, self.time2, 
+                          classtype=" lec")
+        self.assertTrue(self.course1 == course1b)
+        self.assertFalse(self.course1 == self.course2)
+        self.assertEqual({self.course1:1, self.course2:2}[course1b], 1)
+
     def test_timePrefs(self):
         #Each of these should yield a warning.  
         #Times that mismatches on one field
@@ -376,6 +404,52 @@ class TestHelpers(unittest.TestCase):
         self.course2.addRoomPrefs([self.room1, self.room2], False)
         self.assertTrue(hasMsg())
             
+    def test_roomViability(self):
+        courses = [self.course1, self.course2, self.course3]
+        viable = helpers.roomViability(courses, self.roomInventory)
+        self.assertEqual(viable.shape, (3, len(self.roomInventory)))
+        for k, c in enumerate(courses):
+            for j, r in enumerate(self.roomInventory):
+                self.assertEqual(viable[k, j], c.isViableRoom(r))
+
+    def test_slotAdjacency(self):
+        from candidates import CandidateTable
+        cands = CandidateTable([self.course1, self.course2, self.course3], self.roomInventory)
+        cands.genCandidates(self.config, None)
+        self.assertEqual(cands.coursesMatching("15.052", "", "rec"), [2])
+        self.assertEqual(cands.coursesMatching("15.053", "", "LEC"), [])
+
+        adj = cands.slotAdjacency(range(len(cands.timeslots)))
+        for i, ts1 in enumerate(cands.timeslots):
+            for j, ts2 in enumerate(cands.timeslots):
+                self.assertEqual(adj[i, j], ts1.isB2B(ts2))
+
+    def test_keepTimes(self):
+        from candidates import CandidateTable
+        cands = CandidateTable([self.course1, self.course2, self.course3], self.roomInventory)
+        cands.genCandidates(self.config, None)
+        num_cands = len(cands.candidatesOfCourse(1))
+        ts = self.course1.timePrefs[0]
+        cands.keepTimes([ts, None, None])
+        self.assertEqual(len(cands.candidatesOfCourse(1)), num_cands)
+        for i in cands.candidatesOfCourse(0):
+            self.assertEqual(cands.candidate(i)[2], ts)
+        self.assertEqual(len(cands), cands.course_ptr[-1])
+
+        self.assertRaises(SESError, cands.keepTimes, [None, ts, None])
+
+    def test_candidateArrays(self):
+        from candidates import CandidateTable
+        cands = CandidateTable([self.course1, self.course2, self.course3], self.roomInventory)
+        cands.genCandidates(self.config, None)
+        ecap, hits, pref_days = (cands.excessCapacity(), cands.choiceHits(),
+                                 cands.onPreferredDays())
+        for i in range(len(cands)):
+            c, r, ts = cands.candidate(i)
+            self.assertAlmostEqual(ecap[i], helpers.e_cap(c, r))
+            self.assertEqual(hits[0, i], (ts == c.timePrefs[0]) + (r in c.roomPrefs[:1]))
+            self.assertEqual(pref_days[i], c.isPreferredDays(ts))
+
     #Course 1 is a standard lecture
     def test_times_lecture(self):
         viable_times = helpers.allowedTimes(self.course1, self.config)
@@ -411,6 +485,21 @@ class TestHelpers(unittest.TestCase):
             self.assertTrue( t.days[0] in ("W", "Th", "F"))
 
 
+    def test_times_cached(self):
+        #preferences of one course do not leak into another with the same signature
+        ts = TimeSlot("H1", "W", "8:30 AM", "11:30 AM")
+        self.course2.addTimePrefs([ts])
+        self.assertTrue(ts in helpers.allowedTimes(self.course2, self.config))
+        course4 = Course("15.053", "Economics", 50, Instructor("Arnie"), 
+                TimeSlot("H1", "F", "4:00 PM", "7:00 PM"))
+        viable_times = helpers.allowedTimes(course4, self.config)
+        self.assertFalse(ts in viable_times)
+
+        #changing the config changes the slots
+        self.config.LAST_CLASS = "7:00 PM"
+        self.assertEqual(len(helpers.allowedTimes(course4, self.config)), 
+                         len(viable_times) - 2 * len(TimeSlot.daysOfWeek))
+
     def test_invalid_time(self):
         #setting an invalid time (should be H1), respecting room
         #shoudl yield a warning, but still allow room
@@ -430,6 +519,84 @@ class TestHelpers(unittest.TestCase):
         self.assertEqual(helpers.e_cap(self.course3, self.room3), 0)
         self.assertEqual(helpers.e_cap(self.course3, self.room1), 0.15)
 
+    def test_roomClasses(self):
+        room4 = Room("E52-138", 50, ["camera"])
+        room5 = Room("E52-238", 50, ["camera"])
+        rooms = self.roomInventory + [room4, room5]
+        self.assertEqual(helpers.roomClasses(rooms, []),
+                         [[self.room1], [self.room2], [self.room3, room4], [room5]])
+
+        #preferred rooms are singletons
+        self.course1.addRoomPrefs([room4], False)
+        self.assertEqual(helpers.roomClasses(rooms, [self.course1]),
+                         [[self.room1], [self.room2], [self.room3], [room4], [room5]])
+
+        #coarse classes only need to be viable for the same courses
+        room6 = Room("E52-139", 60, ["camera", "projector"])
+        self.assertEqual(helpers.roomClasses(rooms + [room6], [self.course2], coarse=True),
+                         [[self.room1, self.room2], [self.room3, room4, room6], [room5]])
+
+    def test_screen(self):
+        from optimizer_base import OptimizerBase
+        import screening
+        optimizer = OptimizerBase([self.course1, self.course2, self.course3], 
+                                  self.roomInventory, self.config)
+        self.assertEqual(screening.screen(optimizer), [])
+
+        ts = TimeSlot("F", "M W", "10:00 AM", "11:30 AM")
+        a = Course("15.060", "Economics", 40, Instructor("Arnie"), ts, respectTime=True)
+        b = Course("15.061", "Economics", 40, Instructor("Arnie"), 
+                   TimeSlot("F", "M", "10:00 AM", "11:00 AM"), respectTime=True)
+        c = Course("15.062", "Economics", 40, Instructor("Dimitris"), ts, respectTime=True)
+        d = Course("15.063", "Economics", 40, Instructor("Vivek"), ts, respectTime=True)
+        optimizer = OptimizerBase([a, b, c, d], self.roomInventory, self.config, 
+                                  {"Core": [("15.062", "", "LEC"), ("15.063", "", "LEC")]})
+        findings = screening.screen(optimizer)
+        self.assertEqual(set(frozenset(courses) for message, courses in findings), 
+                         set([frozenset([a, b]), frozenset([c, d]), frozenset([a, b, c, d])]))
+
+        #candidates cannot be generated without a room
+        e = Course("15.064", "Economics", 500, Instructor("Vivek"), ts)
+        optimizer = OptimizerBase([a, b, e], self.roomInventory, self.config)
+        self.assertEqual([courses for message, courses in screening.screen(optimizer)], [[e]])
+
+    def test_matchRooms(self):
+        times = [TimeSlot("F", "M", "9:00 AM", "10:30 AM"),
+                 TimeSlot("F", "T", "9:00 AM", "10:30 AM"),
+                 TimeSlot("F", "M T", "10:00 AM", "11:30 AM"),
+                 TimeSlot("F", "M", "11:30 AM", "1:00 PM"),
+                 TimeSlot("F", "M", "1:00 PM", "2:30 PM")]
+        rooms = helpers.matchRooms(times, 2, {4:[3]})
+        for i in range(len(times)):
+            for j in range(i):
+                if times[i].overlap(times[j]):
+                    self.assertNotEqual(rooms[i], rooms[j])
+        self.assertEqual(rooms[3], rooms[4])
+
+        times.append(TimeSlot("F", "M", "10:00 AM", "11:00 AM"))
+        self.assertRaises(SESError, helpers.matchRooms, times, 2)
+
+    def test_matchRooms_multi_day(self):
+        """A time meeting on several days keeps one room.  Rooms are found whenever
+        they exist, even where placing times in order of start fails"""
+        times = [TimeSlot("F", "M", "9:00 AM", "10:00 AM"),
+                 TimeSlot("F", "T", "9:00 AM", "10:00 AM"),
+                 TimeSlot("F", "M", "9:30 AM", "11:00 AM"),
+                 TimeSlot("F", "T", "10:30 AM", "12:00 PM"),
+                 TimeSlot("F", "M T", "10:45 AM", "12:00 PM")]
+        rooms = helpers.matchRooms(times, 2)
+        for i in range(len(times)):
+            for j in range(i):
+                if times[i].overlap(times[j]):
+                    self.assertNotEqual(rooms[i], rooms[j])
+
+        #pairwise overlaps on different days, never more than 2 at once
+        times = [TimeSlot("F", "M W", "10:00 AM", "11:30 AM"),
+                 TimeSlot("F", "W F", "10:00 AM", "11:30 AM"),
+                 TimeSlot("F", "M F", "10:00 AM", "11:30 AM")]
+        self.assertRaises(SESError, helpers.matchRooms, times, 2)
+        self.assertEqual(sorted(helpers.matchRooms(times, 3)), [0, 1, 2])
+
 
 
 